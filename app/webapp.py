@@ -2,10 +2,8 @@ import sys
 import os
 import logging
 from pathlib import Path
-from flask import Flask, request, render_template, jsonify, redirect, url_for, session
+from flask import Flask, Response, request, render_template, jsonify, redirect, url_for, session, stream_with_context
 import json
-import hmac
-import hashlib
 from datetime import datetime
 from dotenv import load_dotenv
 import ssl
@@ -15,12 +13,19 @@ root_dir = str(Path(__file__).parent.parent)
 sys.path.append(root_dir)
 
 # После добавления пути импортируем локальные модули
-from db.database import get_session, init_db
-from db.models import User, Report
+from db.database import get_session, init_db, register_unit_of_work
+from db.models import User, Report, UserRole
 from config.config import TELEGRAM_TOKEN, APP_HOST, APP_PORT
 from services.user_service import UserService
 from services.team_service import TeamService
-from services.report_service import ReportService
+from services.report_service import ReportService, REPORTS_PAGE_SIZE
+from services.report_buffer import report_buffer
+from services.export_service import ExportService
+from services.search_service import SearchService, SEARCH_PAGE_SIZE
+from services.telegram_auth import TelegramAuth
+from services.rate_limiter import create_rate_limiter, rate_limited
+from services.metrics import metrics, instrument_flask, register_metrics_endpoint
+from services.profiler import register_profiler_endpoint
 
 # Инициализация базы данных
 init_db()
@@ -36,8 +41,20 @@ app = Flask(__name__,
 
 app.secret_key = TELEGRAM_TOKEN  # Используем токен бота в качестве секретного ключа для сессий
 
+# Одна сессия БД и одна транзакция на запрос
+register_unit_of_work(app)
+
+# Длительность запросов и эндпоинт /metrics
+instrument_flask(app, 'webapp')
+register_metrics_endpoint(app)
+
 def create_self_signed_cert():
-    """Создание самоподписанного SSL сертификата"""
+    """Самоподписанный SSL сертификат: существующий используется повторно"""
+    cert_path = os.path.join(root_dir, 'cert.pem')
+    key_path = os.path.join(root_dir, 'key.pem')
+    if os.path.exists(cert_path) and os.path.exists(key_path):
+        return cert_path, key_path
+    
     from OpenSSL import crypto
     
     # Генерация ключа
@@ -55,9 +72,6 @@ def create_self_signed_cert():
     cert.sign(key, 'sha256')
     
     # Сохранение сертификата и ключа
-    cert_path = os.path.join(root_dir, 'cert.pem')
-    key_path = os.path.join(root_dir, 'key.pem')
-    
     with open(cert_path, "wb") as f:
         f.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
     with open(key_path, "wb") as f:
@@ -65,32 +79,44 @@ def create_self_signed_cert():
         
     return cert_path, key_path
 
-# Middleware для проверки Telegram данных
-def verify_telegram_data(data):
-    """Проверка подписи данных от Telegram"""
-    if not data:
-        return False
-    
-    received_hash = data.get('hash')
-    auth_date = data.get('auth_date')
-    
-    if not received_hash or not auth_date:
+# Проверка данных Telegram Login Widget (секрет вычисляется один раз, подписи кэшируются)
+telegram_auth = TelegramAuth(TELEGRAM_TOKEN)
+
+# Ограничение частоты запросов по telegram_id с лимитами по ролям (RATE_LIMIT_*)
+rate_limiter = create_rate_limiter()
+
+metrics.register_stats('rate_limiter', rate_limiter.stats, app='webapp')
+metrics.register_stats('cache', telegram_auth.stats, cache='telegram_auth_webapp')
+
+def is_session_admin():
+    """Является ли пользователь текущей сессии администратором"""
+    if 'telegram_id' not in session:
         return False
-    
-    # Удаление хеша из данных для проверки
-    data_check = {k: v for k, v in data.items() if k != 'hash'}
-    
-    # Создание строки для проверки
-    data_check_string = '\n'.join([f"{k}={v}" for k, v in sorted(data_check.items())])
-    
-    # Создание секретного ключа
-    secret_key = hashlib.sha256(TELEGRAM_TOKEN.encode()).digest()
-    
-    # Вычисление хеша
-    computed_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-    
-    # Сравнение хешей
-    return computed_hash == received_hash
+    user = UserService.get_user_by_telegram_id(session['telegram_id'])
+    return bool(user and user.role == UserRole.ADMIN)
+
+# Профилирование процесса по запросу администратора: /admin/profile?seconds=N&requests=N
+register_profiler_endpoint(app, is_session_admin)
+
+def get_report_author():
+    """Telegram ID автора отчета: пользователь сессии или из подписанных данных Telegram Web App.
+
+    Поля формы не учитываются - их может подставить кто угодно.
+    """
+    telegram_id = session.get('telegram_id')
+    if telegram_id is None:
+        init_fields = telegram_auth.validate_init_data(request.headers.get('X-Telegram-Init-Data'))
+        if init_fields:
+            telegram_id = json.loads(init_fields.get('user', '{}')).get('id')
+    return telegram_id
+
+def get_report_author_identity():
+    """Автор отчета и его роль для ограничения частоты запросов"""
+    telegram_id = get_report_author()
+    if telegram_id is None:
+        return None
+    user = UserService.get_user_by_telegram_id(telegram_id)
+    return telegram_id, user.role if user else None
 
 # Главная страница
 @app.route('/')
@@ -104,7 +130,7 @@ def auth():
     """Авторизация пользователя через Telegram Login Widget"""
     data = request.form.to_dict()
     
-    if not verify_telegram_data(data):
+    if not telegram_auth.verify_login_data(data):
         return jsonify({'status': 'error', 'message': 'Недействительные данные аутентификации'}), 403
     
     telegram_id = int(data.get('id'))
@@ -197,40 +223,109 @@ def dashboard():
         session.clear()
         return redirect(url_for('index'))
     
-    # Получение отчетов пользователя
-    reports = ReportService.get_user_reports(user.id)
+    # Получение первой страницы отчетов, остальные подгружаются через API
+    reports, next_cursor = ReportService.get_user_reports_page(user.id)
     
     return render_template('dashboard.html', 
                          user=user,
-                         reports=reports)
+                         reports=reports,
+                         next_cursor=next_cursor)
+
+# Создание отчета из веб-интерфейса
+@app.route('/reports/new', methods=['GET', 'POST'])
+def create_report():
+    """Форма создания отчета на панели управления"""
+    if 'telegram_id' not in session:
+        return redirect(url_for('index'))
+    
+    user = UserService.get_user_by_telegram_id(session.get('telegram_id'))
+    if not user:
+        session.clear()
+        return redirect(url_for('index'))
+    
+    if request.method == 'GET':
+        return render_template('create_report.html')
+    
+    try:
+        report_buffer.submit_and_wait({
+            'user_id': user.id,
+            'team_id': user.team_id,
+            'description': request.form.get('description'),
+            'metric_name': request.form.get('metric_name'),
+            'metric_value': request.form.get('metric_value')
+        })
+    except ValueError as e:
+        return render_template('create_report.html', error=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка при создании отчета: {e}")
+        return render_template('create_report.html', error='Не удалось сохранить отчет')
+    
+    return redirect(url_for('dashboard'))
+
+# API для постраничной загрузки истории отчетов
+@app.route('/api/reports', methods=['GET'])
+def api_user_reports():
+    """API для получения следующей страницы отчетов пользователя"""
+    if 'telegram_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    user = UserService.get_user_by_telegram_id(session.get('telegram_id'))
+    
+    if not user:
+        return jsonify({'status': 'error', 'message': 'Пользователь не найден'}), 404
+    
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', REPORTS_PAGE_SIZE, type=int)
+    
+    if cursor:
+        try:
+            ReportService.decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Неверный курсор'}), 400
+    
+    reports, next_cursor = ReportService.get_user_reports_page(user.id, cursor=cursor, limit=limit)
+    
+    return jsonify({
+        'status': 'success',
+        'data': [ReportService.report_to_dict(report) for report in reports],
+        'next_cursor': next_cursor
+    })
 
 # Создание отчета
 @app.route('/submit_report', methods=['POST'])
+@rate_limited(rate_limiter, get_report_author_identity)
 def submit_report():
     """Обработка отправки отчета"""
     try:
-        with get_session() as session:
-            # Получаем данные из формы
-            description = request.form.get('description')
-            metric_name = request.form.get('metric_name')
-            metric_value = request.form.get('metric_value')
-            user_data = request.form.get('user')
-            
-            if not description:
-                return jsonify({'success': False, 'error': 'Описание обязательно'})
-                
-            # Создаем отчет
-            report = Report(
-                description=description,
-                metric_name=metric_name,
-                metric_value=float(metric_value) if metric_value else None,
-                user_id=user_data['id']
-            )
-            
-            session.add(report)
-            session.commit()
+        # Получаем данные из формы
+        description = request.form.get('description')
+        metric_name = request.form.get('metric_name')
+        metric_value = request.form.get('metric_value')
+        
+        telegram_id = get_report_author()
+        if telegram_id is None:
+            return jsonify({'success': False, 'error': 'Требуется авторизация'}), 403
+        
+        if not description:
+            return jsonify({'success': False, 'error': 'Описание обязательно'})
+        
+        user = UserService.get_user_by_telegram_id(telegram_id)
+        if not user:
+            return jsonify({'success': False, 'error': 'Пользователь не найден'})
             
-            return jsonify({'success': True})
+        # Создаем отчет: запись идет пачками, ответ отправляется после фиксации
+        report_buffer.submit_and_wait({
+            'description': description,
+            'metric_name': metric_name,
+            'metric_value': metric_value,
+            'user_id': user.id,
+            'team_id': user.team_id
+        })
+        
+        return jsonify({'success': True})
+    except ValueError as e:
+        # Отчет не прошел проверку полей (например, нечисловое значение показателя)
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -250,22 +345,143 @@ def api_weekly_reports():
     
     user = UserService.get_user_by_telegram_id(session.get('telegram_id'))
     
-    if not user or (user.role != 'manager' and user.role != 'admin'):
+    if not user or user.role not in (UserRole.MANAGER, UserRole.ADMIN):
+        return jsonify({'status': 'error', 'message': 'Недостаточно прав'}), 403
+    
+    # Руководитель без команды не получает сводку по всем командам
+    if user.role == UserRole.MANAGER and user.team_id is None:
+        return jsonify({'status': 'error', 'message': 'Вы не привязаны к команде'}), 403
+    
+    # Получение еженедельного отчета (кэш процесса или сводка, заранее рассчитанная ботом)
+    team_id = user.team_id if user.role == UserRole.MANAGER else None
+    weekly_summary, summary_text = ReportService.get_cached_weekly_summary(team_id)
+    
+    if weekly_summary is None:
+        return jsonify({'status': 'error', 'message': 'Ошибка при генерации сводки'}), 500
+    
+    return jsonify({
+        'status': 'success',
+        'data': summary_text,
+        'summary': weekly_summary
+    })
+
+def parse_export_date(value, end_of_day=False):
+    """Разбор даты периода экспорта (YYYY-MM-DD или ISO 8601)"""
+    if not value:
+        return None
+    
+    parsed = datetime.fromisoformat(value)
+    # Для конечной даты без времени берем весь день
+    if end_of_day and len(value) == 10:
+        parsed = datetime.combine(parsed.date(), datetime.max.time())
+    return parsed
+
+# Потоковый экспорт отчетов (для руководителей и администраторов)
+@app.route('/api/reports/export', methods=['GET'])
+def api_export_reports():
+    """Экспорт отчетов в CSV или JSONL без загрузки всей выборки в память"""
+    if 'telegram_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    user = UserService.get_user_by_telegram_id(session.get('telegram_id'))
+    
+    if not user or user.role not in (UserRole.MANAGER, UserRole.ADMIN):
         return jsonify({'status': 'error', 'message': 'Недостаточно прав'}), 403
     
-    # Получение еженедельного отчета
-    team_id = user.team_id if user.role == 'manager' else None
-    weekly_summary = ReportService.generate_weekly_summary(team_id)
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return jsonify({'status': 'error', 'message': 'Поддерживаются форматы csv и jsonl'}), 400
+    
+    try:
+        start_date = parse_export_date(request.args.get('start_date'))
+        end_date = parse_export_date(request.args.get('end_date'), end_of_day=True)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Неверный формат даты'}), 400
+    
+    # Руководитель выгружает только свою команду; все команды - только администратор с all_teams=1
+    all_teams = False
+    if user.role == UserRole.MANAGER:
+        if user.team_id is None:
+            return jsonify({'status': 'error', 'message': 'Вы не привязаны к команде'}), 403
+        team_id = user.team_id
+    else:
+        team_id = request.args.get('team_id', type=int)
+        all_teams = team_id is None and request.args.get('all_teams') in ('1', 'true')
+        if team_id is None and not all_teams:
+            return jsonify({'status': 'error', 'message': 'Укажите team_id или all_teams=1'}), 400
+    
+    rows = ReportService.iter_export_rows(team_id=team_id, start_date=start_date, end_date=end_date,
+                                          all_teams=all_teams)
+    if export_format == 'csv':
+        chunks = ExportService.iter_csv(rows)
+        mimetype = 'text/csv'
+    else:
+        chunks = ExportService.iter_jsonl(rows)
+        mimetype = 'application/x-ndjson'
+    
+    filename = f"reports.{export_format}"
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks = ExportService.iter_gzip(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# Полнотекстовый поиск по описаниям отчетов
+@app.route('/api/reports/search', methods=['GET'])
+def api_search_reports():
+    """Поиск отчетов с фильтрами по команде, автору и периоду, постранично"""
+    if 'telegram_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    user = UserService.get_user_by_telegram_id(session.get('telegram_id'))
+    if not user:
+        return jsonify({'status': 'error', 'message': 'Пользователь не найден'}), 404
+    
+    query = request.args.get('q', '')
+    if not SearchService.get_terms(query):
+        return jsonify({'status': 'error', 'message': 'Укажите слова для поиска'}), 400
+    
+    try:
+        start_date = parse_export_date(request.args.get('start_date'))
+        end_date = parse_export_date(request.args.get('end_date'), end_of_day=True)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Неверный формат даты'}), 400
+    
+    # Команду и автора из запроса учитывает только администратор
+    scope = SearchService.get_scope(
+        user,
+        team_id=request.args.get('team_id', type=int),
+        user_id=request.args.get('user_id', type=int)
+    )
+    
+    page = request.args.get('page', 1, type=int)
+    results, has_more = SearchService.search_reports(
+        query,
+        **scope,
+        start_date=start_date,
+        end_date=end_date,
+        page=page,
+        limit=request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    )
     
     return jsonify({
         'status': 'success',
-        'data': weekly_summary
+        'results': results,
+        'page': page,
+        'next_page': page + 1 if has_more else None
     })
 
 def run_app():
     """Запуск Flask приложения"""
-    # Создаем SSL сертификат
-    cert_path, key_path = create_self_signed_cert()
+    # Готовый сертификат из SSL_CERT_FILE/SSL_KEY_FILE или самоподписанный
+    cert_path, key_path = os.getenv('SSL_CERT_FILE'), os.getenv('SSL_KEY_FILE')
+    if not (cert_path and key_path):
+        cert_path, key_path = create_self_signed_cert()
     
     # Настраиваем SSL контекст
     ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
@@ -277,7 +493,7 @@ def run_app():
     logger.info(f"Веб-приложение доступно по адресу: {public_url}")
     
     # Запускаем приложение с SSL
-    app.run(host=APP_HOST, port=APP_PORT, ssl_context=ssl_context, debug=True)
+    app.run(host=APP_HOST, port=APP_PORT, ssl_context=ssl_context, debug=os.getenv('FLASK_DEBUG') == '1')
 
 if __name__ == "__main__":
     run_app() 
\ No newline at end of file
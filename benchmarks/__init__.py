@@ -0,0 +1,3 @@
+"""
+Benchmarks package initialization
+"""
\ No newline at end of file
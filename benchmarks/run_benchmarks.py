@@ -0,0 +1,221 @@
+import sys
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import platform
+import statistics
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.seed import seed_database, SEED_TELEGRAM_ID_BASE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Базовые результаты по умолчанию и допустимое замедление относительно них
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+DEFAULT_THRESHOLD = 0.2
+
+def measure(function, repeat, warmup=2):
+    """Время вызовов function в миллисекундах: min, медиана, p95 и среднее"""
+    for _ in range(warmup):
+        function()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(timings), 3)
+    }
+
+def get_database_info(path):
+    """Число команд, пользователей и отчетов в базе"""
+    connection = sqlite3.connect(path)
+    try:
+        return {
+            table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('teams', 'users', 'reports')
+        }
+    finally:
+        connection.close()
+
+def build_benchmarks(info, rng):
+    """Набор измерений: имя -> функция без аргументов.
+
+    Модули приложения импортируются здесь, после того как DATABASE_URL
+    указывает на базу бенчмарка.
+    """
+    from app.webapp import app
+    from services.report_service import ReportService
+    from services.user_service import UserService
+
+    teams, users = info['teams'], info['users']
+    # Пользователь 1 - администратор, 2..teams+1 - руководители, остальные - сотрудники
+    employee_ids = range(teams + 2, users + 1) or range(1, users + 1)
+    manager_ids = range(2, teams + 2)
+
+    def random_employee():
+        return rng.choice(employee_ids)
+
+    def user_reports():
+        ReportService.get_user_reports(random_employee())
+
+    def weekly_reports():
+        ReportService.get_weekly_reports(rng.randint(1, teams))
+
+    def weekly_summary():
+        ReportService.generate_weekly_summary(rng.randint(1, teams))
+
+    # Кэшированный поиск всегда идет по одному заранее загруженному пользователю
+    cached_telegram_id = SEED_TELEGRAM_ID_BASE + employee_ids[0]
+    UserService.get_user_by_telegram_id(cached_telegram_id)
+
+    def user_by_telegram_id_cached():
+        UserService.get_user_by_telegram_id(cached_telegram_id)
+
+    def user_by_telegram_id_uncached():
+        telegram_id = SEED_TELEGRAM_ID_BASE + random_employee()
+        UserService.invalidate_user_cache(telegram_id)
+        UserService.get_user_by_telegram_id(telegram_id)
+
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['telegram_id'] = SEED_TELEGRAM_ID_BASE + user_id
+            session['user_id'] = user_id
+        return client
+
+    employee_client = client_for(random_employee())
+    manager_client = client_for(rng.choice(manager_ids))
+
+    def check(response):
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.request.path}: HTTP {response.status_code}")
+        # Часть маршрутов сообщает об ошибке в JSON с кодом 200
+        data = response.get_json(silent=True)
+        if isinstance(data, dict) and (data.get('success') is False or data.get('status') == 'error'):
+            raise RuntimeError(f"{response.request.path}: {data.get('error') or data.get('message')}")
+
+    def route_dashboard():
+        check(employee_client.get('/dashboard'))
+
+    def route_submit_report():
+        check(employee_client.post('/submit_report', data={
+            'description': 'бенчмарк отправки отчета',
+            'metric_name': 'Часы',
+            'metric_value': '1.5'
+        }))
+
+    def route_weekly():
+        check(manager_client.get('/api/reports/weekly'))
+
+    return {
+        'report_service.get_user_reports': user_reports,
+        'report_service.get_weekly_reports': weekly_reports,
+        'report_service.generate_weekly_summary': weekly_summary,
+        'user_service.get_user_by_telegram_id.cached': user_by_telegram_id_cached,
+        'user_service.get_user_by_telegram_id.uncached': user_by_telegram_id_uncached,
+        'route.dashboard': route_dashboard,
+        'route.submit_report': route_submit_report,
+        'route.api_reports_weekly': route_weekly
+    }
+
+def compare_with_baseline(results, baseline, threshold):
+    """Сравнение медиан с базовыми результатами; возвращает список регрессий"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or not base.get('median_ms'):
+            continue
+
+        ratio = result['median_ms'] / base['median_ms']
+        result['baseline_median_ms'] = base['median_ms']
+        result['ratio'] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            logger.warning(f"Регрессия {name}: {base['median_ms']} мс -> {result['median_ms']} мс ({ratio:.2f}x)")
+    return regressions
+
+def run_benchmarks(database, repeat=50, only=None, seed=1):
+    """Запуск измерений на готовой базе, возвращает словарь результатов"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.abspath(database)}"
+    # Лимиты запросов не должны отклонять нагрузку бенчмарка
+    for role in ('DEFAULT', 'EMPLOYEE', 'MANAGER', 'ADMIN'):
+        os.environ[f'RATE_LIMIT_{role}'] = '0'
+
+    info = get_database_info(database)
+    benchmarks = build_benchmarks(info, random.Random(seed))
+
+    results = {}
+    for name, function in benchmarks.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        results[name] = measure(function, repeat)
+        logger.info(f"{name}: медиана {results[name]['median_ms']} мс, p95 {results[name]['p95_ms']} мс")
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'database': info
+        },
+        'results': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки слоя сервисов и HTTP-маршрутов")
+    parser.add_argument('--database', default=os.path.join(BENCHMARKS_DIR, 'bench.db'), help="Файл базы SQLite")
+    parser.add_argument('--teams', type=int, default=10)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--reports', type=int, default=100000, help="Число отчетов при создании базы")
+    parser.add_argument('--repeat', type=int, default=50, help="Число замеров каждого бенчмарка")
+    parser.add_argument('--only', nargs='*', help="Запускать только бенчмарки, содержащие эти подстроки")
+    parser.add_argument('--output', help="Файл для результатов JSON (по умолчанию - stdout)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Файл базовых результатов")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимое замедление медианы, доля (0.2 = 20%%)")
+    parser.add_argument('--save-baseline', action='store_true', help="Сохранить результаты как базовые")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        seed_database(args.database, teams=args.teams, users=args.users, reports=args.reports)
+
+    report = run_benchmarks(args.database, repeat=args.repeat, only=args.only)
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"Базовые результаты сохранены в {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(report['results'], json.load(f), args.threshold)
+    report['regressions'] = regressions
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
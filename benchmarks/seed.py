@@ -0,0 +1,131 @@
+import sys
+import os
+import random
+import argparse
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Размер пачки вставки отчетов
+SEED_BATCH_SIZE = 50000
+
+# Первый Telegram ID синтетических пользователей
+SEED_TELEGRAM_ID_BASE = 1000000
+
+WORDS = (
+    "подготовка отчета клиент сервер база данных миграция встреча релиз тестирование "
+    "дизайн документация исправление ошибки интеграция платежи аналитика ревью кода "
+    "настройка мониторинга обучение сотрудников планирование спринта поддержка"
+).split()
+
+METRICS = ('Часы', 'Задачи', 'Звонки', 'Продажи')
+
+def seed_database(path, teams=10, users=1000, reports=100000, days=365, seed=1):
+    """Заполнение файла SQLite синтетическими командами, пользователями и отчетами.
+
+    Схема создается приложением (init_db), отчеты вставляются пачками через
+    sqlite3 с отключенными на время вставки триггерами полнотекстового индекса;
+    индекс и дневные агрегаты перестраиваются в конце.
+    """
+    # Движок приложения должен смотреть на тот же файл
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.abspath(path)}"
+    from db.database import init_db
+    from db.models import REPORT_SEARCH_TABLE, REPORT_SEARCH_DDL
+    from services.rollup_service import RollupService
+
+    init_db()
+    rng = random.Random(seed)
+    now = datetime.now()
+    created_at = now.isoformat(' ')
+
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        if connection.execute("SELECT COUNT(*) FROM reports").fetchone()[0]:
+            logger.info(f"База {path} уже заполнена")
+            return False
+
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT INTO teams (id, name, description, created_at) VALUES (?, ?, ?, ?)",
+            [(team_id, f"Команда {team_id}", None, created_at) for team_id in range(1, teams + 1)]
+        )
+        # Первый пользователь каждой команды - руководитель, пользователь 1 - администратор
+        connection.executemany(
+            "INSERT INTO users (id, telegram_id, name, role, team_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    user_id,
+                    SEED_TELEGRAM_ID_BASE + user_id,
+                    f"Сотрудник {user_id}",
+                    'ADMIN' if user_id == 1 else 'MANAGER' if user_id <= teams + 1 else 'EMPLOYEE',
+                    (user_id - 2) % teams + 1 if user_id > 1 else None,
+                    created_at
+                )
+                for user_id in range(1, users + 1)
+            ]
+        )
+        connection.execute("COMMIT")
+
+        # Триггеры FTS5 заменяются одной перестройкой индекса после вставки
+        for trigger in ('reports_fts_insert', 'reports_fts_delete', 'reports_fts_update'):
+            connection.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+        period = days * 86400
+        inserted = 0
+        while inserted < reports:
+            batch = []
+            for _ in range(min(SEED_BATCH_SIZE, reports - inserted)):
+                user_id = rng.randint(2, users) if users > 1 else 1
+                team_id = (user_id - 2) % teams + 1 if user_id > 1 else None
+                report_date = (now - timedelta(seconds=rng.randrange(period))).isoformat(' ')
+                has_metric = rng.random() < 0.8
+                batch.append((
+                    user_id,
+                    team_id,
+                    ' '.join(rng.choices(WORDS, k=rng.randint(5, 15))),
+                    rng.choice(METRICS) if has_metric else None,
+                    round(rng.uniform(0, 10), 1) if has_metric else None,
+                    report_date,
+                    report_date,
+                    report_date
+                ))
+
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT INTO reports (user_id, team_id, description, metric_name, metric_value, "
+                "report_date, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            connection.execute("COMMIT")
+            inserted += len(batch)
+            logger.info(f"Вставлено отчетов: {inserted}/{reports}")
+
+        for statement in REPORT_SEARCH_DDL:
+            connection.execute(statement)
+        connection.execute(f"INSERT INTO {REPORT_SEARCH_TABLE}({REPORT_SEARCH_TABLE}) VALUES ('rebuild')")
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+
+    RollupService.backfill()
+    logger.info(f"База {path} заполнена: {teams} команд, {users} пользователей, {reports} отчетов")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синтетическая база SQLite для бенчмарков")
+    parser.add_argument('path', help="Файл базы данных")
+    parser.add_argument('--teams', type=int, default=10)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--reports', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=365, help="Период, на который распределяются отчеты")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    seed_database(args.path, args.teams, args.users, args.reports, args.days, args.seed)
@@ -0,0 +1,389 @@
+import sys
+import os
+import hmac
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bot.telegram_stub import TelegramStubServer
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Токен и первый chat_id синтетических пользователей
+REPLAY_TOKEN = '123456:replay'
+REPLAY_CHAT_ID_BASE = 5000000
+
+# Пятничный пик: в основном отправка отчетов, немного новых пользователей
+DEFAULT_MIX = 'start=0.3,register=0.1,report=0.6'
+
+def parse_mix(value):
+    """Разбор доли сценариев вида 'start=0.3,register=0.1,report=0.6'"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('start', 'register', 'report'):
+            raise ValueError(f"Неизвестный сценарий: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(values, percent):
+    """Перцентиль отсортированного списка"""
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 50),
+        'p95_ms': percentile(values, 95),
+        'p99_ms': percentile(values, 99),
+        'max_ms': round(values[-1], 3) if values else None
+    }
+
+class UpdateFactory:
+    """Синтетические обновления Telegram с уникальными update_id и message_id"""
+
+    def __init__(self):
+        self._update_id = int(time.time())
+        self._message_id = 0
+        self._lock = threading.Lock()
+
+    def _next_ids(self):
+        with self._lock:
+            self._update_id += 1
+            self._message_id += 1
+            return self._update_id, self._message_id
+
+    def message(self, chat_id, text):
+        update_id, message_id = self._next_ids()
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f"Нагрузка {chat_id}"},
+            'text': text
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': update_id, 'message': message}
+
+    def renumber(self, update):
+        """Новые update_id для записанного обновления, чтобы его не отсекла дедупликация"""
+        update_id, _ = self._next_ids()
+        return dict(update, update_id=update_id)
+
+def sign_init_data(token, user):
+    """Подписанная строка initData Telegram WebApp для пользователя"""
+    fields = {'auth_date': str(int(time.time())), 'user': json.dumps(user, separators=(',', ':'))}
+    secret = hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+    data_check_string = '\n'.join(f"{k}={v}" for k, v in sorted(fields.items()))
+    fields['hash'] = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+class ReplayResults:
+    """Потокобезопасный сбор задержек и ошибок"""
+
+    def __init__(self):
+        self.ack_latency = {}
+        self.reply_latency = []
+        self.errors = {}
+        self.expected_replies = 0
+        self._pending_replies = {}
+        self._lock = threading.Lock()
+
+    def expect_reply(self, chat_id, message_id, sent_at):
+        with self._lock:
+            self._pending_replies[(str(chat_id), str(message_id))] = sent_at
+            self.expected_replies += 1
+
+    def on_bot_api_call(self, method, params):
+        """Ответ бота пришел в заглушку Bot API"""
+        if method != 'sendMessage':
+            return
+        key = (str(params.get('chat_id')), str(params.get('reply_to_message_id')))
+        received_at = time.perf_counter()
+        with self._lock:
+            sent_at = self._pending_replies.pop(key, None)
+            if sent_at is not None:
+                self.reply_latency.append((received_at - sent_at) * 1000)
+
+    def add_ack(self, kind, latency_ms, status):
+        with self._lock:
+            self.ack_latency.setdefault(kind, []).append(latency_ms)
+            if status != 200:
+                key = f"{kind}:{status}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def missing_replies(self):
+        with self._lock:
+            return len(self._pending_replies)
+
+class Transport:
+    """Отправка обновлений в вебхук и отчетов в веб-приложение: в процессе или по HTTP"""
+
+    def __init__(self, url=None, webapp_url=None):
+        self.url = url
+        self.webapp_url = webapp_url or url
+        self._local = threading.local()
+        if url is None:
+            from bot.telegram_bot import webhook_app, webapp, WEBHOOK_PATH
+            self.webhook_path = WEBHOOK_PATH
+            self._apps = (webhook_app, webapp)
+        else:
+            self.webhook_path = f"/webhook/{os.environ['TELEGRAM_BOT_TOKEN']}"
+
+    def _clients(self):
+        # Клиенты не разделяются между потоками
+        clients = getattr(self._local, 'clients', None)
+        if clients is None:
+            if self.url is None:
+                clients = tuple(app.test_client() for app in self._apps)
+            else:
+                import requests
+                session = requests.Session()
+                clients = (session, session)
+            self._local.clients = clients
+        return clients
+
+    def post_update(self, update):
+        webhook_client, _ = self._clients()
+        if self.url is None:
+            return webhook_client.post(self.webhook_path, json=update).status_code
+        return webhook_client.post(f"{self.url}{self.webhook_path}", json=update, timeout=30, verify=False).status_code
+
+    def post_report(self, init_data, payload):
+        _, webapp_client = self._clients()
+        headers = {'X-Telegram-Init-Data': init_data}
+        if self.url is None:
+            return webapp_client.post('/submit_report', json=payload, headers=headers).status_code
+        return webapp_client.post(f"{self.webapp_url}/submit_report", json=payload, headers=headers,
+                                  timeout=30, verify=False).status_code
+
+class WebhookReplay:
+    """Воспроизведение потока обновлений с заданной частотой"""
+
+    def __init__(self, transport, results, token, reporters, concurrency=32):
+        self.transport = transport
+        self.results = results
+        self.token = token
+        self.reporters = reporters
+        self.factory = UpdateFactory()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._next_chat_id = REPLAY_CHAT_ID_BASE + len(reporters) + 1
+        self._chat_lock = threading.Lock()
+
+    def _new_chat_id(self):
+        with self._chat_lock:
+            self._next_chat_id += 1
+            return self._next_chat_id
+
+    def _send_update(self, kind, update, expect_reply=True):
+        started = time.perf_counter()
+        message = update.get('message')
+        if expect_reply and message:
+            self.results.expect_reply(message['chat']['id'], message['message_id'], started)
+        try:
+            status = self.transport.post_update(update)
+        except Exception as e:
+            logger.error(f"Ошибка отправки обновления: {e}")
+            status = type(e).__name__
+        self.results.add_ack(kind, (time.perf_counter() - started) * 1000, status)
+
+    def _send_report(self, telegram_id):
+        started = time.perf_counter()
+        try:
+            status = self.transport.post_report(
+                sign_init_data(self.token, {'id': telegram_id, 'first_name': 'Нагрузка'}),
+                {'user_id': telegram_id, 'description': 'Отчет нагрузочного теста', 'metric_name': 'Часы',
+                 'metric_value': 1}
+            )
+        except Exception as e:
+            logger.error(f"Ошибка отправки отчета: {e}")
+            status = type(e).__name__
+        self.results.add_ack('report', (time.perf_counter() - started) * 1000, status)
+
+    def steps(self, kind, rng):
+        """Запросы одного сценария: список функций без аргументов"""
+        if kind == 'start':
+            chat_id = self._new_chat_id()
+            return [lambda: self._send_update('start', self.factory.message(chat_id, '/start'))]
+
+        if kind == 'register':
+            # Сообщения диалога идут в один чат и обрабатываются по порядку
+            chat_id = self._new_chat_id()
+            return [
+                lambda: self._send_update('register', self.factory.message(chat_id, '/register')),
+                lambda: self._send_update('register', self.factory.message(chat_id, f"Сотрудник {chat_id}")),
+                lambda: self._send_update('register', self.factory.message(chat_id, '1'))
+            ]
+
+        telegram_id = rng.choice(self.reporters)
+        return [lambda: self._send_report(telegram_id)]
+
+    def run(self, requests_stream, rate):
+        """Отправка запросов с постоянной частотой rate в секунду (открытая модель нагрузки)"""
+        interval = 1.0 / rate
+        started = time.perf_counter()
+        futures = []
+        max_lag = 0.0
+        for index, step in enumerate(requests_stream):
+            scheduled = started + index * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            futures.append(self.executor.submit(step))
+
+        for future in futures:
+            future.result()
+        return time.perf_counter() - started, len(futures), max_lag * 1000
+
+def synthetic_stream(replay, mix, count, rng):
+    """Поток шагов сценариев в случайном порядке согласно долям mix"""
+    kinds, weights = zip(*mix.items())
+    produced = 0
+    while produced < count:
+        for step in replay.steps(rng.choices(kinds, weights)[0], rng):
+            if produced >= count:
+                return
+            yield step
+            produced += 1
+
+def recorded_stream(replay, path):
+    """Поток записанных обновлений (JSON Lines) с новыми update_id"""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                update = replay.factory.renumber(json.loads(line))
+                yield lambda update=update: replay._send_update('recorded', update, expect_reply=False)
+
+def create_reporters(count):
+    """Зарегистрированные пользователи, от имени которых отправляются отчеты"""
+    from db.database import get_session, init_db
+    from db.models import User, UserRole
+
+    init_db()
+    session = get_session()
+    try:
+        telegram_ids = [REPLAY_CHAT_ID_BASE + index for index in range(1, count + 1)]
+        existing = {row[0] for row in session.query(User.telegram_id).filter(User.telegram_id.in_(telegram_ids))}
+        session.add_all([
+            User(telegram_id=telegram_id, name=f"Нагрузка {telegram_id}", role=UserRole.EMPLOYEE)
+            for telegram_id in telegram_ids if telegram_id not in existing
+        ])
+        session.commit()
+        return telegram_ids
+    finally:
+        session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочное воспроизведение обновлений Telegram в вебхук бота")
+    parser.add_argument('--rate', type=float, default=50, help="Запросов в секунду")
+    parser.add_argument('--count', type=int, default=1000, help="Число запросов синтетического потока")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Доли сценариев start/register/report")
+    parser.add_argument('--replay', help="Файл JSON Lines с записанными обновлениями вместо синтетики")
+    parser.add_argument('--reporters', type=int, default=200, help="Число пользователей, отправляющих отчеты")
+    parser.add_argument('--concurrency', type=int, default=32, help="Одновременных запросов")
+    parser.add_argument('--database', default='/tmp/webhook_replay.db',
+                        help="Файл SQLite для запуска в процессе (или база сервера для --url)")
+    parser.add_argument('--url', help="Адрес запущенного сервера вместо запуска бота в процессе")
+    parser.add_argument('--webapp-url', help="Адрес веб-приложения бота, если он отличается от --url")
+    parser.add_argument('--token', default=REPLAY_TOKEN, help="Токен бота (для --url - токен сервера)")
+    parser.add_argument('--stub-port', type=int, default=0, help="Порт заглушки Bot API")
+    parser.add_argument('--rate-limits', action='store_true', help="Не отключать лимиты запросов пользователей")
+    parser.add_argument('--drain-timeout', type=float, default=30, help="Ожидание ответов бота после отправки, с")
+    parser.add_argument('--output', help="Файл для результатов JSON (по умолчанию - stdout)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    results = ReplayResults()
+    stub = TelegramStubServer(port=args.stub_port, on_call=results.on_bot_api_call).start()
+
+    # Настройки процесса бота задаются до импорта его модулей
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': args.token,
+        'TELEGRAM_API_URL': stub.url,
+        'DATABASE_URL': f"sqlite:///{os.path.abspath(args.database)}",
+        'BOT_STATE_STORAGE': os.getenv('BOT_STATE_STORAGE', 'database'),
+        'DIGEST_ENABLED': '0'
+    })
+    if not args.rate_limits:
+        for role in ('DEFAULT', 'EMPLOYEE', 'MANAGER', 'ADMIN'):
+            os.environ[f'RATE_LIMIT_{role}'] = '0'
+
+    if args.url:
+        logger.info(f"Сервер должен отправлять запросы Bot API в заглушку: TELEGRAM_API_URL={stub.url}")
+
+    reporters = create_reporters(args.reporters)
+    transport = Transport(args.url, args.webapp_url)
+    if args.url is None:
+        from bot.telegram_bot import start_background_workers
+        start_background_workers(scheduler=False)
+
+    rng = random.Random(args.seed)
+    replay = WebhookReplay(transport, results, args.token, reporters, concurrency=args.concurrency)
+    if args.replay:
+        stream = recorded_stream(replay, args.replay)
+    else:
+        stream = synthetic_stream(replay, parse_mix(args.mix), args.count, rng)
+
+    elapsed, sent, max_lag_ms = replay.run(stream, args.rate)
+
+    # Ожидание ответов, которые бот отправляет асинхронно
+    deadline = time.monotonic() + args.drain_timeout
+    while results.missing_replies() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if args.url is None:
+        # Записанные обновления не сопоставляются с ответами: ждем опустошения очередей
+        from bot.telegram_bot import update_dispatcher, outbound
+        while time.monotonic() < deadline:
+            dispatcher_stats, outbound_stats = update_dispatcher.stats(), outbound.stats()
+            pending = dispatcher_stats['accepted'] - dispatcher_stats['processed'] - dispatcher_stats['failed']
+            if not pending and not outbound_stats['queued']:
+                break
+            time.sleep(0.05)
+
+    report = {
+        'target_rate': args.rate,
+        'sent': sent,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(sent / elapsed, 2) if elapsed else None,
+        'max_schedule_lag_ms': round(max_lag_ms, 3),
+        'ack_latency': {kind: latency_summary(values) for kind, values in results.ack_latency.items()},
+        'reply_latency': latency_summary(results.reply_latency),
+        'errors': results.errors,
+        'error_rate': round(sum(results.errors.values()) / sent, 4) if sent else 0,
+        'expected_replies': results.expected_replies,
+        'missing_replies': results.missing_replies(),
+        'bot_api_calls': len(stub.get_calls())
+    }
+
+    if args.url is None:
+        from bot.telegram_bot import stop_background_workers
+        report['update_dispatcher'] = update_dispatcher.stats()
+        report['outbound'] = outbound.stats()
+        stop_background_workers()
+    stub.stop()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0 if not results.errors else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
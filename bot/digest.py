@@ -0,0 +1,108 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from db.models import UserRole
+from services.report_service import ReportService
+from services.user_service import UserService
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Рассылка еженедельного дайджеста руководителям: включение, день недели (0 - понедельник) и время ЧЧ:ММ
+DIGEST_ENABLED = os.getenv('DIGEST_ENABLED', '1') == '1'
+DIGEST_WEEKDAY = int(os.getenv('DIGEST_WEEKDAY', '0'))
+DIGEST_TIME = os.getenv('DIGEST_TIME', '09:00')
+
+# Максимальная длина сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+def get_next_run(now, weekday, at_time):
+    """Ближайший момент рассылки после now"""
+    hour, minute = (int(part) for part in at_time.split(':'))
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    run_at += timedelta(days=(weekday - now.weekday()) % 7)
+    if run_at <= now:
+        run_at += timedelta(days=7)
+    return run_at
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Разбиение длинного текста на сообщения по границам строк"""
+    parts = []
+    current = ''
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ''
+        current += line
+    if current.strip():
+        parts.append(current)
+    return parts
+
+def send_weekly_digest(sender):
+    """Расчет сводок всех команд одним запросом и отправка каждому руководителю сводки его команды"""
+    summaries = ReportService.precompute_weekly_summaries()
+    managers = UserService.get_all_users(role=UserRole.MANAGER)
+
+    sent = 0
+    for manager in managers:
+        if not manager.team_id:
+            continue
+
+        summary = summaries.get(manager.team_id)
+        if summary is None:
+            # Команда без отчетов за неделю - короткая сводка тоже попадет в кэш
+            summary = ReportService.get_cached_weekly_summary(manager.team_id)
+
+        _, text = summary
+        for part in split_message(text):
+            sender.send_message(manager.telegram_id, part)
+        sent += 1
+
+    logger.info(f"Еженедельный дайджест отправлен руководителям: {sent}")
+    return sent
+
+class WeeklyDigestScheduler:
+    """Фоновый поток, который раз в неделю рассылает дайджест"""
+
+    def __init__(self, sender, weekday=DIGEST_WEEKDAY, at_time=DIGEST_TIME):
+        self.sender = sender
+        self.weekday = weekday
+        self.at_time = at_time
+        self._last_run = datetime.min
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск потока планировщика (повторный вызов ничего не делает)"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="weekly-digest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Остановка планировщика"""
+        self._stop_event.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            # От момента прошлой рассылки, чтобы ранний выход из ожидания не повторил ее
+            run_at = get_next_run(max(datetime.now(), self._last_run), self.weekday, self.at_time)
+            logger.info(f"Следующая рассылка дайджеста: {run_at:%Y-%m-%d %H:%M}")
+            if self._stop_event.wait((run_at - datetime.now()).total_seconds()):
+                return
+            self._last_run = run_at
+            try:
+                send_weekly_digest(self.sender)
+            except Exception as e:
+                logger.error(f"Ошибка при рассылке дайджеста: {e}")
@@ -0,0 +1,237 @@
+import os
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Адрес Bot API (для тестов можно указать локальную заглушку bot/telegram_stub.py)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+# Потоки отправки, общий лимит сообщений в секунду и минимальный интервал между сообщениями в один чат
+OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', '4'))
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_INTERVAL = float(os.getenv('OUTBOUND_CHAT_INTERVAL', '1.0'))
+
+# Число повторов и начальная задержка повтора при сетевых ошибках и ответах 5xx
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '5'))
+OUTBOUND_RETRY_DELAY = float(os.getenv('OUTBOUND_RETRY_DELAY', '1.0'))
+
+class TelegramAPIError(Exception):
+    """Ошибка, которую вернул Bot API"""
+
+    def __init__(self, error_code, description, retry_after=None):
+        super().__init__(f"{error_code}: {description}")
+        self.error_code = error_code
+        self.description = description
+        self.retry_after = retry_after
+
+class OutboundMessage:
+    """Сообщение в очереди отправки"""
+    __slots__ = ('chat_id', 'method', 'params', 'future', 'attempts')
+
+    def __init__(self, chat_id, method, params):
+        self.chat_id = chat_id
+        self.method = method
+        self.params = params
+        self.future = Future()
+        self.attempts = 0
+
+class OutboundDispatcher:
+    """Очередь исходящих запросов к Bot API с пулом keep-alive соединений.
+
+    Сообщения одного чата отправляются по порядку и не чаще chat_interval
+    секунд, все чаты вместе - не чаще global_rate сообщений в секунду.
+    На ответ 429 чат откладывается на retry_after секунд, на сетевые
+    ошибки и 5xx - с экспоненциально растущей задержкой.
+    """
+
+    def __init__(self, token, api_url=TELEGRAM_API_URL, workers=OUTBOUND_WORKERS,
+                 global_rate=OUTBOUND_GLOBAL_RATE, chat_interval=OUTBOUND_CHAT_INTERVAL,
+                 max_retries=OUTBOUND_MAX_RETRIES, retry_delay=OUTBOUND_RETRY_DELAY):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self.workers = workers
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self._http.mount('https://', adapter)
+        self._http.mount('http://', adapter)
+
+        self._chats = {}  # chat_id -> очередь сообщений чата
+        self._ready = []  # куча (время готовности, порядковый номер, chat_id)
+        self._scheduled = set()  # чаты в куче или в процессе отправки
+        self._sequence = 0
+        self._next_send = 0.0
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopped = False
+        self._counters = {'submitted': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'rate_limited': 0}
+
+    def start(self):
+        """Запуск потоков отправки (повторный вызов ничего не делает)"""
+        with self._condition:
+            if self._threads:
+                return
+            self._stopped = False
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"outbound-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Запущено потоков отправки сообщений: {self.workers}")
+
+    def submit(self, chat_id, method, **params):
+        """Постановка запроса к Bot API в очередь чата, возвращает Future с результатом"""
+        if not self._threads:
+            self.start()
+
+        message = OutboundMessage(chat_id, method, dict(params, chat_id=chat_id))
+        with self._condition:
+            self._chats.setdefault(chat_id, deque()).append(message)
+            self._counters['submitted'] += 1
+            if chat_id not in self._scheduled:
+                self._schedule(chat_id, time.monotonic())
+        return message.future
+
+    def send_message(self, chat_id, text, reply_markup=None, **params):
+        """Отправка текстового сообщения"""
+        if reply_markup is not None:
+            params['reply_markup'] = reply_markup.to_json() if hasattr(reply_markup, 'to_json') else reply_markup
+        return self.submit(chat_id, 'sendMessage', text=text, **params)
+
+    def reply_to(self, message, text, **params):
+        """Ответ на сообщение пользователя (аналог TeleBot.reply_to)"""
+        return self.send_message(message.chat.id, text, reply_to_message_id=message.message_id, **params)
+
+    def broadcast(self, chat_ids, text, **params):
+        """Отправка одного текста в несколько чатов, возвращает список Future"""
+        return [self.send_message(chat_id, text, **params) for chat_id in chat_ids]
+
+    def stop(self, timeout=None):
+        """Отправка уже принятых сообщений и остановка потоков"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            threads, self._threads = self._threads, []
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self):
+        """Счетчики отправки и число сообщений в очереди"""
+        with self._condition:
+            stats = dict(self._counters)
+            stats['queued'] = sum(len(queue) for queue in self._chats.values())
+            stats['chats'] = len(self._chats)
+        return stats
+
+    def _schedule(self, chat_id, ready_at):
+        self._sequence += 1
+        heapq.heappush(self._ready, (ready_at, self._sequence, chat_id))
+        self._scheduled.add(chat_id)
+        self._condition.notify()
+
+    def _next_message(self):
+        """Ожидание чата, готового к отправке, с учетом общего лимита"""
+        with self._condition:
+            while True:
+                if not self._ready:
+                    if self._stopped:
+                        return None
+                    self._condition.wait()
+                    continue
+
+                now = time.monotonic()
+                ready_at = max(self._ready[0][0], self._next_send)
+                if ready_at > now:
+                    self._condition.wait(ready_at - now)
+                    continue
+
+                _, _, chat_id = heapq.heappop(self._ready)
+                self._next_send = max(self._next_send, now) + self.global_interval
+                # Чат остается в _scheduled до завершения отправки, чтобы сохранить порядок
+                return self._chats[chat_id][0]
+
+    def _finish(self, message, delay):
+        """Снятие отправленного сообщения с очереди и планирование следующего"""
+        with self._condition:
+            queue = self._chats[message.chat_id]
+            queue.popleft()
+            if queue:
+                self._schedule(message.chat_id, time.monotonic() + delay)
+            else:
+                del self._chats[message.chat_id]
+                self._scheduled.discard(message.chat_id)
+
+    def _retry(self, message, delay):
+        """Повтор того же сообщения через delay секунд"""
+        with self._condition:
+            self._counters['retried'] += 1
+            self._schedule(message.chat_id, time.monotonic() + delay)
+
+    def _call(self, message):
+        response = self._http.post(f"{self.base_url}/{message.method}", data=message.params, timeout=30)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {'ok': False, 'error_code': response.status_code, 'description': response.text}
+
+        if payload.get('ok'):
+            return payload.get('result')
+
+        parameters = payload.get('parameters') or {}
+        raise TelegramAPIError(
+            payload.get('error_code', response.status_code),
+            payload.get('description', ''),
+            retry_after=parameters.get('retry_after')
+        )
+
+    def _run(self):
+        while True:
+            message = self._next_message()
+            if message is None:
+                return
+
+            message.attempts += 1
+            try:
+                result = self._call(message)
+            except TelegramAPIError as e:
+                if e.error_code == 429:
+                    with self._condition:
+                        self._counters['rate_limited'] += 1
+                if e.error_code == 429 and message.attempts <= self.max_retries:
+                    logger.warning(f"Ограничение Telegram для чата {message.chat_id}, повтор через {e.retry_after} с")
+                    self._retry(message, e.retry_after or self.retry_delay)
+                    continue
+                if e.error_code >= 500 and message.attempts <= self.max_retries:
+                    self._retry(message, self.retry_delay * 2 ** (message.attempts - 1))
+                    continue
+                self._fail(message, e)
+                continue
+            except requests.RequestException as e:
+                if message.attempts <= self.max_retries:
+                    self._retry(message, self.retry_delay * 2 ** (message.attempts - 1))
+                    continue
+                self._fail(message, e)
+                continue
+
+            with self._condition:
+                self._counters['sent'] += 1
+            self._finish(message, self.chat_interval)
+            message.future.set_result(result)
+
+    def _fail(self, message, error):
+        logger.error(f"Ошибка при отправке сообщения в чат {message.chat_id}: {error}")
+        with self._condition:
+            self._counters['failed'] += 1
+        self._finish(message, self.chat_interval)
+        message.future.set_exception(error)
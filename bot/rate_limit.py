@@ -0,0 +1,34 @@
+import logging
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
+from services.cache import TTLCache
+from services.user_service import UserService
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Ограничение частоты сообщений и нажатий кнопок от одного пользователя"""
+
+    def __init__(self, sender, limiter, notice_interval=60):
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+        self.sender = sender  # объект с методом send_message(chat_id, text)
+        self.limiter = limiter
+        # Предупреждение о лимите отправляется не чаще раза в notice_interval секунд
+        self._notified = TTLCache(maxsize=10000, ttl=notice_interval)
+
+    def pre_process(self, message, data):
+        telegram_id = message.from_user.id
+        user = UserService.get_user_by_telegram_id(telegram_id)
+        if self.limiter.allow(telegram_id, user.role if user else None):
+            return None
+
+        logger.warning(f"Превышен лимит запросов: пользователь {telegram_id}")
+        if self._notified.get(telegram_id) is None:
+            self._notified.set(telegram_id, True)
+            chat_id = message.chat.id if hasattr(message, 'chat') else telegram_id
+            self.sender.send_message(chat_id, "Слишком много запросов. Попробуйте немного позже.")
+        return CancelUpdate()
+
+    def post_process(self, message, data, exception):
+        pass
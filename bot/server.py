@@ -0,0 +1,162 @@
+import os
+import time
+import fcntl
+import logging
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Режим запуска: development - отладочные серверы Flask, production - gunicorn
+SERVER_MODE = os.getenv('SERVER_MODE', 'development')
+
+# Адрес, число процессов и потоков в каждом процессе production-сервера
+WSGI_HOST = os.getenv('WSGI_HOST', '0.0.0.0')
+WSGI_PORT = int(os.getenv('WSGI_PORT', '8443'))
+WSGI_WORKERS = int(os.getenv('WSGI_WORKERS', '1'))
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '8'))
+WSGI_TIMEOUT = int(os.getenv('WSGI_TIMEOUT', '30'))
+
+# Готовый сертификат и ключ для HTTPS (пусто - HTTP за обратным прокси)
+SSL_CERT_FILE = os.getenv('SSL_CERT_FILE')
+SSL_KEY_FILE = os.getenv('SSL_KEY_FILE')
+
+# Интервал в секундах, с которым процессы пытаются захватить блокировку разовых задач
+SINGLETON_RETRY_INTERVAL = float(os.getenv('SINGLETON_RETRY_INTERVAL', '5'))
+
+# Открытый файл блокировки разовых задач, если ее держит этот процесс
+_singleton_lock = None
+
+def singleton_lock_path(master_pid):
+    """Файл блокировки разовых задач, свой для каждого запуска главного процесса"""
+    return os.path.join(tempfile.gettempdir(), f"report-bot-{master_pid}.lock")
+
+def acquire_singleton_lock():
+    """Захват блокировки разовых задач без ожидания.
+
+    Блокировка flock держится до завершения процесса и снимается системой,
+    даже если процесс упал.
+    """
+    global _singleton_lock
+    lock_file = open(singleton_lock_path(os.getppid()), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _singleton_lock = lock_file
+    return True
+
+def run_singletons():
+    """Вебхук и рассылка дайджеста в процессе, который держит блокировку.
+
+    Процессы, не получившие блокировку, периодически пробуют снова: когда
+    держатель перезапускается (max_requests, падение, HUP), задачи
+    подхватывает один из оставшихся или новых процессов.
+    """
+    from bot.telegram_bot import setup_webhook, digest_scheduler, DIGEST_ENABLED
+
+    while not acquire_singleton_lock():
+        time.sleep(SINGLETON_RETRY_INTERVAL)
+
+    logger.info(f"Процесс {os.getpid()} выполняет разовые задачи: вебхук и рассылку дайджеста")
+    try:
+        setup_webhook()
+    except Exception as e:
+        logger.error(f"Ошибка при настройке вебхука: {e}")
+    if DIGEST_ENABLED:
+        digest_scheduler.start()
+
+def check_shared_backends(workers):
+    """Описание проблемы, если процессов больше одного, а общие хранилища не настроены"""
+    if workers <= 1:
+        return None
+    missing = [
+        name for name, configured in (
+            ('UPDATE_DEDUP_DB', bool(os.getenv('UPDATE_DEDUP_DB'))),
+            ('RATE_LIMIT_DB', bool(os.getenv('RATE_LIMIT_DB'))),
+            ('BOT_STATE_STORAGE=database', os.getenv('BOT_STATE_STORAGE', 'database') == 'database')
+        ) if not configured
+    ]
+    if missing:
+        return f"для WSGI_WORKERS={workers} нужны общие хранилища: {', '.join(missing)}"
+    return None
+
+def post_fork(server, worker):
+    # Соединения пула, открытые до fork, принадлежат главному процессу
+    from db.database import engine
+    engine.dispose(close=False)
+
+def post_worker_init(worker):
+    # Модуль бота импортируется в каждом процессе, фоновые потоки запускаются после fork
+    from bot.telegram_bot import start_background_workers
+    start_background_workers(scheduler=False)
+    # Вебхук и рассылка дайджеста нужны в одном процессе - в том, что держит блокировку
+    threading.Thread(target=run_singletons, name="singletons", daemon=True).start()
+
+def worker_exit(server, worker):
+    from bot.telegram_bot import stop_background_workers
+    stop_background_workers()
+
+def on_exit(server):
+    try:
+        os.remove(singleton_lock_path(os.getpid()))
+    except OSError:
+        pass
+
+def get_server_options():
+    """Настройки gunicorn из переменных окружения"""
+    options = {
+        'bind': f"{WSGI_HOST}:{WSGI_PORT}",
+        'workers': WSGI_WORKERS,
+        'threads': WSGI_THREADS,
+        'worker_class': 'gthread',
+        'timeout': WSGI_TIMEOUT,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+        'on_exit': on_exit
+    }
+    if SSL_CERT_FILE and SSL_KEY_FILE:
+        options['certfile'] = SSL_CERT_FILE
+        options['keyfile'] = SSL_KEY_FILE
+    return options
+
+def run_production_server():
+    """Запуск вебхука и веб-интерфейса одним WSGI-приложением в gunicorn.
+
+    Главный процесс не импортирует модуль бота: каждый рабочий процесс
+    создает свои соединения и фоновые потоки. По умолчанию процесс один.
+    Больше одного процесса запускается только с общими хранилищами
+    дедупликации, лимитов и диалогов (UPDATE_DEDUP_DB, RATE_LIMIT_DB,
+    BOT_STATE_STORAGE=database); порядок обновлений одного чата между
+    процессами при этом не гарантируется.
+    """
+    problem = check_shared_backends(WSGI_WORKERS)
+    if problem:
+        logger.error(f"Production-сервер не запущен: {problem}")
+        return False
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.error("Для режима production установите gunicorn: pip install gunicorn")
+        return False
+
+    class BotApplication(BaseApplication):
+        def load_config(self):
+            for key, value in get_server_options().items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from bot.telegram_bot import create_wsgi_app
+            return create_wsgi_app()
+
+    logger.info(f"Production-сервер: {WSGI_WORKERS} процессов по {WSGI_THREADS} потоков на порту {WSGI_PORT}")
+    BotApplication().run()
+    return True
@@ -0,0 +1,162 @@
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from telebot.storage import StateMemoryStorage
+from telebot.storage.base_storage import StateStorageBase, StateContext
+from db.database import get_session, commit_session, rollback_session, close_session
+from db.models import BotState
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class DatabaseStateStorage(StateStorageBase):
+    """Хранилище состояний бота в базе данных, общее для всех процессов.
+
+    Диалоги, не обновлявшиеся дольше ttl секунд, считаются брошенными:
+    они не возвращаются при чтении и удаляются методом compact().
+    """
+
+    def __init__(self, ttl=86400):
+        super().__init__()
+        self.ttl = ttl
+
+    def _expired_before(self):
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def _get_record(self, session, chat_id, user_id):
+        record = session.get(BotState, (chat_id, user_id))
+        if record is not None and record.updated_at < self._expired_before():
+            return None
+        return record
+
+    def set_state(self, chat_id, user_id, state):
+        if hasattr(state, 'name'):
+            state = state.name
+
+        session = get_session()
+        try:
+            record = session.get(BotState, (chat_id, user_id))
+            if record is None:
+                record = BotState(chat_id=chat_id, user_id=user_id, data='{}')
+                session.add(record)
+            elif record.updated_at < self._expired_before():
+                # Просроченный диалог начинается заново
+                record.data = '{}'
+
+            record.state = state
+            record.updated_at = datetime.utcnow()
+            commit_session(session)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояния: {e}")
+            rollback_session(session)
+            raise
+        finally:
+            close_session(session)
+
+    def delete_state(self, chat_id, user_id):
+        session = get_session()
+        try:
+            deleted = session.query(BotState).filter(
+                BotState.chat_id == chat_id,
+                BotState.user_id == user_id
+            ).delete()
+            commit_session(session)
+            return bool(deleted)
+        except Exception as e:
+            logger.error(f"Ошибка при удалении состояния: {e}")
+            rollback_session(session)
+            raise
+        finally:
+            close_session(session)
+
+    def get_state(self, chat_id, user_id):
+        session = get_session()
+        try:
+            record = self._get_record(session, chat_id, user_id)
+            return record.state if record else None
+        finally:
+            close_session(session)
+
+    def get_data(self, chat_id, user_id):
+        session = get_session()
+        try:
+            record = self._get_record(session, chat_id, user_id)
+            return json.loads(record.data) if record else None
+        finally:
+            close_session(session)
+
+    def reset_data(self, chat_id, user_id):
+        return self._update_data(chat_id, user_id, lambda data: {})
+
+    def set_data(self, chat_id, user_id, key, value):
+        def update(data):
+            data[key] = value
+            return data
+
+        if not self._update_data(chat_id, user_id, update):
+            raise RuntimeError('chat_id {} and user_id {} does not exist'.format(chat_id, user_id))
+        return True
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    def save(self, chat_id, user_id, data):
+        return self._update_data(chat_id, user_id, lambda _: data)
+
+    def _update_data(self, chat_id, user_id, update):
+        session = get_session()
+        try:
+            record = self._get_record(session, chat_id, user_id)
+            if record is None:
+                return False
+
+            record.data = json.dumps(update(json.loads(record.data)), ensure_ascii=False)
+            record.updated_at = datetime.utcnow()
+            commit_session(session)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных состояния: {e}")
+            rollback_session(session)
+            raise
+        finally:
+            close_session(session)
+
+    def compact(self):
+        """Удаление просроченных диалогов, возвращает число удаленных записей"""
+        session = get_session()
+        try:
+            deleted = session.query(BotState).filter(
+                BotState.updated_at < self._expired_before()
+            ).delete(synchronize_session=False)
+            commit_session(session)
+            if deleted:
+                logger.info(f"Удалено просроченных состояний бота: {deleted}")
+            return deleted
+        except Exception as e:
+            logger.error(f"Ошибка при очистке состояний бота: {e}")
+            rollback_session(session)
+            return 0
+        finally:
+            close_session(session)
+
+def start_compaction(storage, interval=3600):
+    """Запуск фоновой периодической очистки просроченных состояний"""
+    stop_event = threading.Event()
+
+    def sweep():
+        while not stop_event.wait(interval):
+            storage.compact()
+
+    thread = threading.Thread(target=sweep, name="state-compaction", daemon=True)
+    thread.start()
+    return stop_event
+
+def create_state_storage(backend='database', ttl=86400):
+    """Создание хранилища состояний: 'database' или 'memory'"""
+    if backend == 'memory':
+        return StateMemoryStorage()
+    if backend == 'database':
+        return DatabaseStateStorage(ttl=ttl)
+    raise ValueError(f"Неизвестное хранилище состояний: {backend}")
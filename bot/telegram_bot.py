@@ -1,15 +1,28 @@
 import os
-import logging
+import json
 import hashlib
-import hmac
-from urllib.parse import parse_qs
+import logging
 from telebot import TeleBot
 from telebot.handler_backends import State, StatesGroup
-from telebot.storage import StateMemoryStorage
 from dotenv import load_dotenv
-from db.database import get_session
+from db.database import get_session, commit_session, close_session, run_after_commit, unit_of_work, register_unit_of_work
 from db.models import User, UserRole, Report
-from telebot import types
+from services.user_service import UserService
+from services.report_buffer import report_buffer
+from services.stats_service import StatsService
+from services.search_service import SearchService
+from services.cache import TTLCache
+from services.telegram_auth import TelegramAuth
+from services.rate_limiter import create_rate_limiter
+from services.metrics import metrics, instrument_flask, instrument_handlers, register_metrics_endpoint
+from services.profiler import profiler, register_profiler_endpoint
+from bot.update_queue import UpdateDispatcher
+from bot.update_dedup import create_update_ids_store
+from bot.state_storage import create_state_storage, start_compaction
+from bot.rate_limit import RateLimitMiddleware
+from bot.outbound import OutboundDispatcher, TELEGRAM_API_URL
+from bot.digest import WeeklyDigestScheduler, DIGEST_ENABLED, split_message
+from telebot import types, apihelper, custom_filters
 from flask import Flask, request, abort, render_template, jsonify
 
 # Настройка логирования
@@ -23,10 +36,63 @@ load_dotenv()
 webhook_app = Flask(__name__)  # Для вебхуков
 template_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'templates'))
 webapp = Flask(__name__, template_folder=template_dir)  # Для веб-интерфейса
+register_unit_of_work(webapp)  # Одна сессия БД на запрос
+
+# Длительность запросов обоих приложений и эндпоинт /metrics веб-интерфейса
+instrument_flask(webhook_app, 'webhook')
+instrument_flask(webapp, 'bot_webapp')
+register_metrics_endpoint(webapp)
+
+# Хранилище состояний диалогов: 'database' (общее для процессов) или 'memory'.
+# Диалоги старше BOT_STATE_TTL секунд считаются брошенными и периодически удаляются
+BOT_STATE_STORAGE = os.getenv('BOT_STATE_STORAGE', 'database')
+BOT_STATE_TTL = int(os.getenv('BOT_STATE_TTL', '86400'))
+BOT_STATE_COMPACT_INTERVAL = int(os.getenv('BOT_STATE_COMPACT_INTERVAL', '3600'))
+
+# Адрес Bot API можно заменить локальной заглушкой (TELEGRAM_API_URL)
+apihelper.API_URL = f"{TELEGRAM_API_URL.rstrip('/')}/bot{{0}}/{{1}}"
+
+# Инициализация бота с хранилищем состояний.
+# Обработчики выполняются в потоках UpdateDispatcher, поэтому собственный пул telebot отключен
+state_storage = create_state_storage(BOT_STATE_STORAGE, ttl=BOT_STATE_TTL)
+bot = TeleBot(os.getenv('TELEGRAM_BOT_TOKEN'), state_storage=state_storage, threaded=False,
+              use_class_middlewares=True)
+# Без фильтра состояний обработчики с state=... не вызываются
+bot.add_custom_filter(custom_filters.StateFilter(bot))
+
+# Ответы обработчиков ставятся в очередь отправки и не ждут ответа Telegram
+outbound = OutboundDispatcher(os.getenv('TELEGRAM_BOT_TOKEN'))
+
+# Ограничение частоты запросов по telegram_id с лимитами по ролям (RATE_LIMIT_*)
+rate_limiter = create_rate_limiter()
+bot.setup_middleware(RateLimitMiddleware(outbound, rate_limiter))
+
+# Еженедельная рассылка сводок руководителям команд (DIGEST_*)
+digest_scheduler = WeeklyDigestScheduler(outbound)
+
+# Проверка initData от Telegram Web App (секрет вычисляется один раз, подписи кэшируются)
+telegram_auth = TelegramAuth(os.getenv('TELEGRAM_BOT_TOKEN'))
 
-# Инициализация бота с хранилищем состояний
-state_storage = StateMemoryStorage()
-bot = TeleBot(os.getenv('TELEGRAM_BOT_TOKEN'), state_storage=state_storage)
+# Очередь входящих обновлений: число потоков-обработчиков и размер очереди каждого потока
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '4'))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+
+def process_update(update):
+    """Обработка одного обновления в рамках единой сессии БД"""
+    with unit_of_work():
+        bot.process_new_updates([update])
+    profiler.note_request()
+
+update_dispatcher = UpdateDispatcher(
+    process_update,
+    workers=UPDATE_WORKERS,
+    queue_size=UPDATE_QUEUE_SIZE
+)
+
+# Недавно полученные update_id для отсечения повторных доставок.
+# Если задан UPDATE_DEDUP_DB, множество хранится в SQLite и переживает перезапуск
+UPDATE_DEDUP_SIZE = int(os.getenv('UPDATE_DEDUP_SIZE', '10000'))
+seen_updates = create_update_ids_store(os.getenv('UPDATE_DEDUP_DB'), maxsize=UPDATE_DEDUP_SIZE)
 
 # Порты для разных сервисов
 WEBHOOK_PORT = 8443  # Порт для вебхуков бота
@@ -40,6 +106,23 @@ WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
 # Путь для веб-приложения
 WEBAPP_URL = f"{WEBHOOK_HOST}/report"
 
+# Период статистики для команд /stats и /my_stats в днях
+STATS_DAYS = int(os.getenv('STATS_DAYS', '30'))
+
+# Поисковые запросы, не поместившиеся в callback_data кнопки "Далее", по короткому ID
+search_queries = TTLCache(maxsize=10000, ttl=3600)
+
+# Предельный размер callback_data inline-кнопки в байтах (ограничение Telegram)
+CALLBACK_DATA_LIMIT = 64
+
+# Очереди, кэши и лимиты процесса бота в /metrics
+metrics.register_stats('update_dispatcher', update_dispatcher.stats)
+metrics.register_stats('outbound', outbound.stats)
+metrics.register_stats('update_dedup', seen_updates.stats)
+metrics.register_stats('rate_limiter', rate_limiter.stats, app='bot')
+metrics.register_stats('cache', telegram_auth.stats, cache='telegram_auth_bot')
+metrics.register_stats('cache', search_queries.stats, cache='search_queries')
+
 # Определение состояний для регистрации
 class RegistrationStates(StatesGroup):
     waiting_for_name = State()
@@ -52,73 +135,65 @@ class ReportStates(StatesGroup):
 @bot.message_handler(commands=['start'])
 def start(message):
     """Обработчик команды /start"""
-    session = get_session()
-    try:
-        # Проверяем, зарегистрирован ли пользователь
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        
-        if user:
-            bot.reply_to(message, 
-                        f"С возвращением, {user.name}!\n"
-                        "Доступные команды:\n"
-                        "/start - показать это сообщение\n"
-                        "/help - показать справку\n"
-                        "/report - создать отчет")
-        else:
-            bot.reply_to(message, 
-                        "Добро пожаловать! Для начала работы необходимо зарегистрироваться.\n"
-                        "Используйте команду /register для регистрации.")
-    finally:
-        session.close()
+    # Проверяем, зарегистрирован ли пользователь
+    user = UserService.get_user_by_telegram_id(message.from_user.id)
+    
+    if user:
+        outbound.reply_to(message, 
+                    f"С возвращением, {user.name}!\n"
+                    "Доступные команды:\n"
+                    "/start - показать это сообщение\n"
+                    "/help - показать справку\n"
+                    "/report - создать отчет")
+    else:
+        outbound.reply_to(message, 
+                    "Добро пожаловать! Для начала работы необходимо зарегистрироваться.\n"
+                    "Используйте команду /register для регистрации.")
 
 @bot.message_handler(commands=['help'])
 def help(message):
     """Обработчик команды /help"""
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        
-        if user:
-            if user.role == UserRole.ADMIN:
-                help_text = ("Справка по использованию бота:\n"
-                           "1. /report - создать отчет\n"
-                           "2. /stats - просмотр статистики\n"
-                           "3. /manage_users - управление пользователями\n"
-                           "4. /settings - настройки системы")
-            elif user.role == UserRole.MANAGER:
-                help_text = ("Справка по использованию бота:\n"
-                           "1. /report - создать отчет\n"
-                           "2. /stats - просмотр статистики по команде\n"
-                           "3. /team - управление командой")
-            else:
-                help_text = ("Справка по использованию бота:\n"
-                           "1. /report - создать отчет\n"
-                           "2. /my_stats - просмотр личной статистики")
+    user = UserService.get_user_by_telegram_id(message.from_user.id)
+    
+    if user:
+        if user.role == UserRole.ADMIN:
+            help_text = ("Справка по использованию бота:\n"
+                       "1. /report - создать отчет\n"
+                       "2. /stats - просмотр статистики\n"
+                       "3. /manage_users - управление пользователями\n"
+                       "4. /settings - настройки системы\n"
+                       "5. /search - поиск по всем отчетам\n"
+                       "6. /profile - профилирование бота")
+        elif user.role == UserRole.MANAGER:
+            help_text = ("Справка по использованию бота:\n"
+                       "1. /report - создать отчет\n"
+                       "2. /stats - просмотр статистики по команде\n"
+                       "3. /team - управление командой\n"
+                       "4. /search - поиск по отчетам команды")
         else:
             help_text = ("Справка по использованию бота:\n"
-                        "1. /register - зарегистрироваться в системе\n"
-                        "2. /help - показать эту справку")
-        
-        bot.reply_to(message, help_text)
-    finally:
-        session.close()
+                       "1. /report - создать отчет\n"
+                       "2. /my_stats - просмотр личной статистики\n"
+                       "3. /search - поиск по своим отчетам")
+    else:
+        help_text = ("Справка по использованию бота:\n"
+                    "1. /register - зарегистрироваться в системе\n"
+                    "2. /help - показать эту справку")
+    
+    outbound.reply_to(message, help_text)
 
 @bot.message_handler(commands=['register'])
 def register(message):
     """Начало процесса регистрации"""
-    session = get_session()
-    try:
-        # Проверяем, не зарегистрирован ли уже пользователь
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        if user:
-            bot.reply_to(message, "Вы уже зарегистрированы в системе!")
-            return
-
-        # Запрашиваем имя
-        bot.set_state(message.from_user.id, RegistrationStates.waiting_for_name, message.chat.id)
-        bot.reply_to(message, "Пожалуйста, введите ваше имя:")
-    finally:
-        session.close()
+    # Проверяем, не зарегистрирован ли уже пользователь
+    user = UserService.get_user_by_telegram_id(message.from_user.id)
+    if user:
+        outbound.reply_to(message, "Вы уже зарегистрированы в системе!")
+        return
+
+    # Запрашиваем имя
+    bot.set_state(message.from_user.id, RegistrationStates.waiting_for_name, message.chat.id)
+    outbound.reply_to(message, "Пожалуйста, введите ваше имя:")
 
 @bot.message_handler(state=RegistrationStates.waiting_for_name)
 def process_name(message):
@@ -128,7 +203,7 @@ def process_name(message):
     bot.add_data(message.from_user.id, message.chat.id, name=message.text)
     
     # Запрашиваем роль
-    bot.reply_to(message, 
+    outbound.reply_to(message, 
                 "Выберите вашу роль:\n"
                 "1 - Сотрудник\n"
                 "2 - Руководитель\n"
@@ -163,61 +238,184 @@ def process_role(message):
                 role=role
             )
             session.add(new_user)
-            session.commit()
+            commit_session(session)
+            # Кэш сбрасывается после фиксации единицы работы обновления
+            run_after_commit(session, lambda: UserService.invalidate_user_cache(message.from_user.id))
             
             # Сбрасываем состояние
             bot.delete_state(message.from_user.id, message.chat.id)
             
-            bot.reply_to(message, 
+            outbound.reply_to(message, 
                         f"Регистрация успешно завершена!\n"
                         f"Имя: {name}\n"
                         f"Роль: {role.value}\n\n"
                         "Используйте /help для просмотра доступных команд.")
         finally:
-            session.close()
+            close_session(session)
             
     except (ValueError, TypeError):
-        bot.reply_to(message, "Пожалуйста, выберите роль цифрой от 1 до 3")
+        outbound.reply_to(message, "Пожалуйста, выберите роль цифрой от 1 до 3")
 
 @bot.message_handler(commands=['report'])
 def report_command(message):
     """Обработчик команды /report"""
-    with get_session() as session:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        if not user:
-            bot.reply_to(message, "Пожалуйста, сначала зарегистрируйтесь с помощью команды /register")
-            return
-            
-        bot.reply_to(message, "Нажмите кнопку меню в нижней части экрана, чтобы создать отчет")
+    user = UserService.get_user_by_telegram_id(message.from_user.id)
+    if not user:
+        outbound.reply_to(message, "Пожалуйста, сначала зарегистрируйтесь с помощью команды /register")
+        return
+        
+    outbound.reply_to(message, "Нажмите кнопку меню в нижней части экрана, чтобы создать отчет")
+
+def reply_in_parts(message, text):
+    """Ответ, разбитый на сообщения не длиннее лимита Telegram"""
+    for index, part in enumerate(split_message(text)):
+        if index == 0:
+            outbound.reply_to(message, part)
+        else:
+            outbound.send_message(message.chat.id, part)
 
-# Удаляем старые обработчики отчетов, так как теперь используется веб-интерфейс
-@bot.message_handler(state=ReportStates.waiting_for_description)
-def process_description(message):
-    pass  # Оставляем пустую функцию для обратной совместимости
+@bot.message_handler(commands=['stats'])
+def stats_command(message):
+    """Обработчик команды /stats: статистика команды или всей организации"""
+    user = UserService.get_user_by_telegram_id(message.from_user.id)
+    if not user or user.role not in (UserRole.MANAGER, UserRole.ADMIN):
+        outbound.reply_to(message, "Команда доступна только руководителям и администраторам")
+        return
+    
+    # Руководитель видит свою команду, администратор - все команды
+    if user.role == UserRole.MANAGER and user.team_id is None:
+        outbound.reply_to(message, "Вы не привязаны к команде, статистика команды недоступна")
+        return
+    team_id = user.team_id if user.role == UserRole.MANAGER else None
+    stats = StatsService.get_stats(team_id=team_id, days=STATS_DAYS)
+    reply_in_parts(message, StatsService.format_stats(stats, days=STATS_DAYS))
+
+@bot.message_handler(commands=['my_stats'])
+def my_stats_command(message):
+    """Обработчик команды /my_stats: личная статистика"""
+    user = UserService.get_user_by_telegram_id(message.from_user.id)
+    if not user:
+        outbound.reply_to(message, "Пожалуйста, сначала зарегистрируйтесь с помощью команды /register")
+        return
+    
+    stats = StatsService.get_stats(user_id=user.id, days=STATS_DAYS)
+    reply_in_parts(message, StatsService.format_stats(stats, days=STATS_DAYS))
+
+def encode_search_callback(query, page):
+    """callback_data кнопки перехода к странице page поиска query.
+
+    Запрос передается в самой кнопке, поэтому старые сообщения с
+    результатами листают свой поиск, а не последний поиск пользователя.
+    Длинный запрос заменяется коротким ID из search_queries.
+    """
+    data = f"search:q:{page}:{query}"
+    if len(data.encode()) <= CALLBACK_DATA_LIMIT:
+        return data
+    query_id = hashlib.sha1(query.encode()).hexdigest()[:16]
+    search_queries.set(query_id, query)
+    return f"search:id:{page}:{query_id}"
 
-@bot.message_handler(state=ReportStates.waiting_for_metric_name)
-def process_metric_name(message):
-    pass  # Оставляем пустую функцию для обратной совместимости
+def decode_search_callback(data):
+    """Запрос и номер страницы из callback_data; запрос None, если ID устарел или данные неверны"""
+    try:
+        _, kind, page, value = data.split(':', 3)
+        page = int(page)
+    except ValueError:
+        return None, 1
+    if kind == 'id':
+        return search_queries.get(value), page
+    return (value if kind == 'q' else None), page
 
-@bot.message_handler(state=ReportStates.waiting_for_metric_value)
-def process_metric_value(message):
-    pass  # Оставляем пустую функцию для обратной совместимости
+def send_search_page(chat_id, user, query, page):
+    """Отправка страницы результатов поиска с кнопкой следующей страницы"""
+    results, has_more = SearchService.search_reports(query, page=page, **SearchService.get_scope(user))
+    reply_markup = None
+    if has_more:
+        reply_markup = types.InlineKeyboardMarkup()
+        reply_markup.add(types.InlineKeyboardButton("Далее", callback_data=encode_search_callback(query, page + 1)))
+    outbound.send_message(chat_id, SearchService.format_results(query, results, page), reply_markup=reply_markup)
 
-def create_report_in_db(message):
-    pass  # Оставляем пустую функцию для обратной совместимости
+@bot.message_handler(commands=['search'])
+def search_command(message):
+    """Обработчик команды /search <текст>: поиск по описаниям отчетов"""
+    user = UserService.get_user_by_telegram_id(message.from_user.id)
+    if not user:
+        outbound.reply_to(message, "Пожалуйста, сначала зарегистрируйтесь с помощью команды /register")
+        return
+    
+    query = message.text.partition(' ')[2].strip()
+    if not SearchService.get_terms(query):
+        outbound.reply_to(message, "Укажите слова для поиска: /search <текст>")
+        return
+    
+    send_search_page(message.chat.id, user, query, page=1)
+
+@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith('search:'))
+def search_page_callback(call):
+    """Переход на следующую страницу результатов поиска"""
+    outbound.submit(call.message.chat.id, 'answerCallbackQuery', callback_query_id=call.id)
+    user = UserService.get_user_by_telegram_id(call.from_user.id)
+    query, page = decode_search_callback(call.data)
+    if not user or not query:
+        outbound.send_message(call.message.chat.id, "Поиск устарел, повторите команду /search")
+        return
+    
+    # Область поиска определяется по нажавшему кнопку, а не по данным кнопки
+    send_search_page(call.message.chat.id, user, query, page=page)
+
+@bot.message_handler(commands=['profile'])
+def profile_command(message):
+    """Обработчик команды /profile [секунды] [запросы]: профилирование процесса бота"""
+    user = UserService.get_user_by_telegram_id(message.from_user.id)
+    if not user or user.role != UserRole.ADMIN:
+        outbound.reply_to(message, "Команда доступна только администраторам")
+        return
+    
+    try:
+        args = [int(arg) for arg in message.text.split()[1:3]]
+    except ValueError:
+        outbound.reply_to(message, "Использование: /profile [секунды] [число запросов]")
+        return
+    seconds = args[0] if args else 10
+    requests = args[1] if len(args) > 1 else None
+    
+    def send_profile(result):
+        path = result.save()
+        text = result.format_top()
+        if path:
+            text += f"\n\nСвернутые стеки для flamegraph: {path}"
+        for part in split_message(text):
+            outbound.send_message(message.chat.id, part)
+    
+    # Результат придет отдельным сообщением, обработчик не ждет завершения
+    if profiler.start(seconds=seconds, requests=requests, on_complete=send_profile) is None:
+        outbound.reply_to(message, "Профилирование уже запущено")
+        return
+    outbound.reply_to(message, f"Профилирование запущено на {min(seconds, profiler.max_seconds)} с")
 
 # Обработчик всех остальных сообщений должен быть последним
 @bot.message_handler(func=lambda message: True, state=None)
 def echo_all(message):
     """Обработчик всех остальных сообщений"""
-    bot.reply_to(message, "Извините, я понимаю только команды. Используйте /help для справки")
+    outbound.reply_to(message, "Извините, я понимаю только команды. Используйте /help для справки")
+
+# Длительность каждого обработчика в метриках (после объявления всех обработчиков)
+instrument_handlers(bot)
 
 @webhook_app.route(WEBHOOK_PATH, methods=['POST'])
 def webhook():
     if request.headers.get('content-type') == 'application/json':
         json_string = request.get_data().decode('utf-8')
         update = types.Update.de_json(json_string)
-        bot.process_new_updates([update])
+        # Повторная доставка уже принятого обновления
+        if not seen_updates.add(update.update_id):
+            logger.info(f"Повторное обновление {update.update_id} пропущено")
+            return ''
+        # Обработка идет в фоне, Telegram получает ответ сразу
+        if not update_dispatcher.submit(update):
+            # Очередь переполнена: Telegram повторит доставку позже
+            seen_updates.discard(update.update_id)
+            return 'Queue is full', 503
         return ''
     else:
         abort(403)
@@ -235,7 +433,8 @@ def setup_webhook():
     commands = [
         types.BotCommand("start", "Начать работу"),
         types.BotCommand("help", "Показать справку"),
-        types.BotCommand("register", "Зарегистрироваться")
+        types.BotCommand("register", "Зарегистрироваться"),
+        types.BotCommand("search", "Поиск по отчетам")
     ]
     bot.set_my_commands(commands)
     
@@ -247,10 +446,43 @@ def setup_webhook():
     )
     bot.set_chat_menu_button(menu_button=menu_button)
 
+def start_background_workers(scheduler=True):
+    """Запуск фоновых потоков процесса: обработчики обновлений и очистка диалогов.
+
+    scheduler=False отключает рассылку дайджеста - при нескольких процессах
+    она должна работать только в одном из них.
+    """
+    update_dispatcher.start()
+    outbound.start()
+    report_buffer.start()
+    
+    # Периодическая очистка брошенных диалогов
+    if hasattr(state_storage, 'compact'):
+        start_compaction(state_storage, interval=BOT_STATE_COMPACT_INTERVAL)
+    
+    if scheduler and DIGEST_ENABLED:
+        digest_scheduler.start()
+
+def stop_background_workers():
+    """Обработка принятых обновлений и запись оставшихся отчетов перед остановкой процесса"""
+    digest_scheduler.stop()
+    update_dispatcher.stop()
+    outbound.stop()
+    report_buffer.stop()
+
+def create_wsgi_app():
+    """Одно WSGI-приложение: вебхук по WEBHOOK_PATH, остальные пути - веб-интерфейс"""
+    def application(environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(WEBHOOK_PATH):
+            return webhook_app(environ, start_response)
+        return webapp(environ, start_response)
+    return application
+
 def start_bot():
-    """Запуск бота"""
+    """Запуск бота на отладочных серверах Flask"""
     logger.info("Бот запущен")
     setup_webhook()
+    start_background_workers()
     
     # Запускаем оба приложения в разных потоках
     from threading import Thread
@@ -270,31 +502,17 @@ def start_bot():
     webhook_thread.join()
     webapp_thread.join()
 
-def validate_telegram_data(init_data):
-    """Проверка данных от Telegram Web App"""
-    try:
-        # Разбираем строку init_data
-        parsed_data = dict(parse_qs(init_data))
-        
-        # Получаем хэш
-        received_hash = parsed_data.get('hash', [None])[0]
-        if not received_hash:
-            return False
-            
-        # Удаляем хэш из данных для проверки
-        del parsed_data['hash']
-        
-        # Сортируем оставшиеся параметры
-        data_check_string = '\n'.join(f"{k}={v[0]}" for k, v in sorted(parsed_data.items()))
-        
-        # Создаем хэш
-        secret_key = hmac.new(b"WebAppData", os.getenv('TELEGRAM_BOT_TOKEN').encode(), hashlib.sha256).digest()
-        calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-        
-        return calculated_hash == received_hash
-    except Exception as e:
-        logger.error(f"Error validating Telegram data: {e}")
+def is_webapp_admin():
+    """Является ли пользователь из подписанных данных Telegram Web App администратором"""
+    init_fields = telegram_auth.validate_init_data(request.headers.get('X-Telegram-Init-Data'))
+    if not init_fields:
         return False
+    telegram_user = json.loads(init_fields.get('user', '{}'))
+    user = UserService.get_user_by_telegram_id(telegram_user.get('id'))
+    return bool(user and user.role == UserRole.ADMIN)
+
+# Профилирование процесса по запросу администратора: /admin/profile?seconds=N&requests=N
+register_profiler_endpoint(webapp, is_webapp_admin)
 
 @webapp.route('/report')
 def report_form():
@@ -313,9 +531,18 @@ def submit_report():
     try:
         # Проверяем данные от Telegram
         init_data = request.headers.get('X-Telegram-Init-Data')
-        if not init_data or not validate_telegram_data(init_data):
+        init_fields = telegram_auth.validate_init_data(init_data)
+        if not init_fields:
             logger.error("Invalid Telegram data")
             return jsonify({'error': 'Invalid Telegram data'}), 403
+
+        # Лимит проверяется по пользователю из подписанных данных, а не из тела запроса
+        telegram_user = json.loads(init_fields.get('user', '{}'))
+        if telegram_user.get('id'):
+            user = UserService.get_user_by_telegram_id(telegram_user['id'])
+            if not rate_limiter.allow(telegram_user['id'], user.role if user else None):
+                logger.warning(f"Rate limit exceeded for user {telegram_user['id']}")
+                return jsonify({'error': 'Too many requests'}), 429
             
         data = request.get_json()
         if not data:
@@ -325,7 +552,8 @@ def submit_report():
         description = data.get('description', '')
         metric_name = data.get('metric_name')
         metric_value = data.get('metric_value')
-        user_id = data.get('user_id')
+        # Автор отчета - пользователь из подписанных данных, а не поле user_id тела запроса
+        user_id = telegram_user.get('id')
         
         if not description:
             logger.error("Description is required")
@@ -336,27 +564,25 @@ def submit_report():
             return jsonify({'error': 'User ID is required'}), 400
         
         # Получаем пользователя
-        session = get_session()
-        try:
-            user = session.query(User).filter_by(telegram_id=user_id).first()
-            if not user:
-                logger.error(f"User not found: {user_id}")
-                return jsonify({'error': 'User not found'}), 404
-                
-            # Создаем отчет
-            report = Report(
-                user_id=user.id,
-                team_id=user.team_id,
-                description=description,
-                metric_name=metric_name,
-                metric_value=metric_value
-            )
-            session.add(report)
-            session.commit()
-            logger.info(f"Report created successfully: {report}")
-            return jsonify({'success': True, 'message': 'Report created successfully'})
-        finally:
-            session.close()
+        user = UserService.get_user_by_telegram_id(user_id)
+        if not user:
+            logger.error(f"User not found: {user_id}")
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Создаем отчет: запись идет пачками, ответ отправляется после фиксации
+        report_buffer.submit_and_wait({
+            'user_id': user.id,
+            'team_id': user.team_id,
+            'description': description,
+            'metric_name': metric_name,
+            'metric_value': metric_value
+        })
+        logger.info(f"Report created successfully for user {user.id}")
+        return jsonify({'success': True, 'message': 'Report created successfully'})
+    except ValueError as e:
+        # Отчет не прошел проверку полей (например, нечисловое значение показателя)
+        logger.error(f"Invalid report: {e}")
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error creating report: {e}")
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,136 @@
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class TelegramStubServer:
+    """Локальная заглушка Bot API для проверки исходящих сообщений без обращения к Telegram.
+
+    Запоминает все вызовы и может имитировать ограничение частоты: каждый
+    rate_limit_every-й запрос получает ответ 429 с retry_after. on_call
+    вызывается для каждого принятого вызова с аргументами (method, params).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, rate_limit_every=0, retry_after=1, on_call=None):
+        self.on_call = on_call
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.calls = []
+        self._requests = 0
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="telegram-stub", daemon=True)
+        self._thread.start()
+        logger.info(f"Заглушка Bot API запущена на {self.url}")
+        return self
+
+    def serve_forever(self):
+        """Работа сервера в текущем потоке"""
+        logger.info(f"Заглушка Bot API запущена на {self.url}")
+        self._server.serve_forever()
+
+    def stop(self):
+        """Остановка сервера"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_calls(self, method=None):
+        """Принятые вызовы (method, params), при необходимости только указанного метода"""
+        with self._lock:
+            return [call for call in self.calls if method is None or call[0] == method]
+
+    def handle_call(self, method, params):
+        """Ответ Bot API на вызов method"""
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self._requests += 1
+            if self.rate_limit_every and self._requests % self.rate_limit_every == 0:
+                return 429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f"Too Many Requests: retry after {self.retry_after}",
+                    'parameters': {'retry_after': self.retry_after}
+                }
+            self.calls.append((method, params))
+            if self.on_call is not None:
+                self.on_call(method, params)
+
+            if method == 'sendMessage':
+                self._message_id += 1
+                return 200, {'ok': True, 'result': {
+                    'message_id': self._message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                    'text': params.get('text', '')
+                }}
+
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}}
+        return 200, {'ok': True, 'result': True}
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1, чтобы клиенты могли переиспользовать соединения
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                method = self.path.rstrip('/').rsplit('/', 1)[-1]
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode('utf-8')
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(body or '{}')
+                else:
+                    params = dict(parse_qsl(body, keep_blank_values=True))
+
+                status, payload = stub.handle_call(method, params)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="Задержка ответа в секундах")
+    parser.add_argument('--rate-limit-every', type=int, default=0, help="Каждый N-й запрос получает 429")
+    args = parser.parse_args()
+
+    server = TelegramStubServer(args.host, args.port, latency=args.latency, rate_limit_every=args.rate_limit_every)
+    logger.info(f"Укажите TELEGRAM_API_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+        sys.exit(0)
@@ -0,0 +1,101 @@
+import logging
+import sqlite3
+import threading
+from collections import deque
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class RecentUpdateIds:
+    """Ограниченное множество недавно полученных update_id (кольцевой буфер)"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.duplicates = 0
+        self._order = deque()
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def add(self, update_id):
+        """Запоминание update_id; False, если он уже встречался"""
+        with self._lock:
+            if update_id in self._seen:
+                self.duplicates += 1
+                return False
+
+            self._seen.add(update_id)
+            self._order.append(update_id)
+
+            # Вытесняем самые старые идентификаторы
+            while len(self._order) > self.maxsize:
+                self._seen.discard(self._order.popleft())
+            return True
+
+    def discard(self, update_id):
+        """Забыть update_id, например если обновление не было принято в обработку"""
+        with self._lock:
+            if update_id in self._seen:
+                self._seen.discard(update_id)
+                self._order.remove(update_id)
+
+    def stats(self):
+        """Размер множества и число отброшенных повторов"""
+        with self._lock:
+            return {'size': len(self._seen), 'maxsize': self.maxsize, 'duplicates': self.duplicates}
+
+class SQLiteUpdateIds:
+    """Множество полученных update_id в файле SQLite, сохраняется между перезапусками"""
+
+    def __init__(self, path, maxsize=10000):
+        self.maxsize = maxsize
+        self.duplicates = 0
+        self._inserts = 0
+        # Очистка старых записей выполняется раз в десятую часть емкости
+        self._prune_every = max(1, maxsize // 10)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS processed_updates (update_id INTEGER PRIMARY KEY)"
+        )
+
+    def add(self, update_id):
+        """Запоминание update_id; False, если он уже встречался"""
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO processed_updates (update_id) VALUES (?)", (update_id,)
+            )
+            if cursor.rowcount == 0:
+                self.duplicates += 1
+                return False
+
+            self._inserts += 1
+            if self._inserts % self._prune_every == 0:
+                self._prune()
+            return True
+
+    def discard(self, update_id):
+        """Забыть update_id, например если обновление не было принято в обработку"""
+        with self._lock:
+            self._connection.execute("DELETE FROM processed_updates WHERE update_id = ?", (update_id,))
+
+    def stats(self):
+        """Размер множества и число отброшенных повторов"""
+        with self._lock:
+            size = self._connection.execute("SELECT COUNT(*) FROM processed_updates").fetchone()[0]
+            return {'size': size, 'maxsize': self.maxsize, 'duplicates': self.duplicates}
+
+    def _prune(self):
+        # update_id в Telegram возрастают, поэтому храним только самые новые
+        self._connection.execute(
+            "DELETE FROM processed_updates WHERE update_id <= "
+            "(SELECT update_id FROM processed_updates ORDER BY update_id DESC LIMIT 1 OFFSET ?)",
+            (self.maxsize,)
+        )
+
+def create_update_ids_store(path=None, maxsize=10000):
+    """Создание хранилища update_id: в SQLite, если указан путь, иначе в памяти"""
+    if path:
+        logger.info(f"Дедупликация обновлений хранится в {path}")
+        return SQLiteUpdateIds(path, maxsize=maxsize)
+    return RecentUpdateIds(maxsize=maxsize)
@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def get_chat_key(update):
+    """Ключ упорядочивания обновления: чат, пользователь или само обновление"""
+    message = update.message or update.edited_message
+    if message is not None:
+        return message.chat.id
+
+    if update.callback_query is not None:
+        return update.callback_query.from_user.id
+
+    return update.update_id
+
+class UpdateDispatcher:
+    """Очередь входящих обновлений Telegram с пулом потоков-обработчиков.
+
+    Каждому потоку соответствует своя ограниченная очередь, а обновления
+    распределяются по ключу чата, поэтому сообщения одного чата
+    обрабатываются строго по порядку.
+    """
+
+    def __init__(self, process_update, workers=4, queue_size=1000):
+        self.process_update = process_update
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counters = {'accepted': 0, 'processed': 0, 'failed': 0, 'dropped': 0}
+
+    def start(self):
+        """Запуск потоков-обработчиков (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._threads:
+                return
+
+            for index, worker_queue in enumerate(self._queues):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(worker_queue,),
+                    name=f"update-worker-{index}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+        logger.info(f"Запущено обработчиков обновлений: {self.workers}")
+
+    def submit(self, update):
+        """Постановка обновления в очередь; False, если очередь переполнена"""
+        if not self._threads:
+            self.start()
+
+        worker_queue = self._queues[hash(get_chat_key(update)) % self.workers]
+        try:
+            worker_queue.put_nowait(update)
+        except queue.Full:
+            self._increment('dropped')
+            logger.warning(f"Очередь обновлений переполнена, обновление {update.update_id} отклонено")
+            return False
+
+        self._increment('accepted')
+        return True
+
+    def stop(self, timeout=None):
+        """Остановка обработчиков после разбора уже принятых обновлений"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+
+        for worker_queue in self._queues:
+            worker_queue.put(None)
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self):
+        """Счетчики обработки и текущая глубина очередей"""
+        with self._lock:
+            stats = dict(self._counters)
+
+        stats['queue_depth'] = sum(worker_queue.qsize() for worker_queue in self._queues)
+        stats['queue_size'] = self.queue_size
+        stats['workers'] = self.workers
+        return stats
+
+    def _increment(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _worker(self, worker_queue):
+        while True:
+            update = worker_queue.get()
+            if update is None:
+                break
+
+            try:
+                self.process_update(update)
+                self._increment('processed')
+            except Exception as e:
+                self._increment('failed')
+                logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
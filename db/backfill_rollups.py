@@ -0,0 +1,22 @@
+import sys
+import os
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.database import init_db
+from services.rollup_service import RollupService
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def backfill_rollups():
+    """Перестроение дневных агрегатов показателей по всем отчетам"""
+    init_db()
+    count = RollupService.backfill()
+    if count is None:
+        logger.error("Не удалось перестроить агрегаты показателей")
+        return False
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if backfill_rollups() else 1)
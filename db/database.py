@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
+from contextlib import contextmanager
 import os
+import threading
 from dotenv import load_dotenv
+from services.metrics import instrument_engine
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -13,24 +16,185 @@ os.makedirs('db', exist_ok=True)
 # Получение URL базы данных из переменных окружения
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///db/database.db')
 
-# Создание движка базы данных
-engine = create_engine(DATABASE_URL)
+# Профиль настройки движка: 'production' (WAL, пул соединений) или 'default'
+DATABASE_PROFILE = os.getenv('DATABASE_PROFILE', 'production')
 
-# Создание фабрики сессий
-session_factory = sessionmaker(bind=engine)
+# PRAGMA для SQLite в рабочем режиме: WAL позволяет читать во время записи,
+# synchronous=NORMAL в WAL безопасен и убирает fsync на каждую транзакцию
+SQLITE_PRODUCTION_PRAGMAS = [
+    ('busy_timeout', int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))),
+    ('cache_size', int(os.getenv('SQLITE_CACHE_SIZE', '-65536'))),  # отрицательное значение - в КиБ
+    ('temp_store', 'MEMORY'),
+]
+
+def create_database_engine(url, profile='production'):
+    """Создание движка базы данных с настройками выбранного профиля"""
+    if profile not in ('production', 'default'):
+        raise ValueError(f"Неизвестный профиль базы данных: {profile}")
+
+    if url.startswith('sqlite'):
+        engine = create_engine(url)
+
+        # Для базы в памяти PRAGMA рабочего режима не нужны
+        if profile == 'production' and ':memory:' not in url:
+            @event.listens_for(engine, 'connect')
+            def set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for name, value in SQLITE_PRODUCTION_PRAGMAS:
+                    cursor.execute(f"PRAGMA {name}={value}")
+                cursor.close()
+
+        return engine
+
+    if profile == 'production':
+        # Пул соединений для серверных СУБД (PostgreSQL)
+        return create_engine(
+            url,
+            pool_size=int(os.getenv('DB_POOL_SIZE', '10')),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '20')),
+            pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', '30')),
+            pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+            pool_pre_ping=True
+        )
+
+    return create_engine(url)
+
+# Создание движка базы данных; длительность запросов попадает в метрики (SLOW_QUERY_MS)
+engine = create_database_engine(DATABASE_URL, DATABASE_PROFILE)
+instrument_engine(engine)
+
+# Создание фабрики сессий.
+# Объекты не устаревают при commit, чтобы оставаться читаемыми после закрытия сессии
+session_factory = sessionmaker(bind=engine, expire_on_commit=False)
 Session = scoped_session(session_factory)
 
+# Глубина вложенности единицы работы в текущем потоке
+_unit_of_work = threading.local()
+
 # Базовый класс для моделей
 Base = declarative_base()
 
 def init_db():
     """Инициализация базы данных"""
     # Импорт моделей для создания таблиц
-    from .models import User, Team, Task, Report
+    from .models import User, Team, Task, Report, BotState, MetricDailyRollup, WeeklySummary
     
     # Создание таблиц
     Base.metadata.create_all(engine)
+
+    # Приведение уже существующей базы к актуальной схеме (колонки, индексы, FTS)
+    from .init_db import migrate_database
+    migrate_database(engine)
     
 def get_session():
     """Получение сессии базы данных"""
-    return Session() 
\ No newline at end of file
+    return Session()
+
+def in_unit_of_work():
+    """Выполняется ли код внутри единицы работы"""
+    return getattr(_unit_of_work, 'depth', 0) > 0
+
+def begin_unit_of_work():
+    """Начало единицы работы: сервисы используют одну сессию до ее завершения"""
+    depth = getattr(_unit_of_work, 'depth', 0)
+    if depth == 0:
+        _unit_of_work.failed = False
+    _unit_of_work.depth = depth + 1
+
+def commit_unit_of_work():
+    """Фиксация транзакции внешней единицы работы, если в ней не было ошибок сервисов"""
+    if getattr(_unit_of_work, 'depth', 0) == 1 and not getattr(_unit_of_work, 'failed', False):
+        Session().commit()
+
+def rollback_unit_of_work():
+    """Откат транзакции единицы работы; до ее завершения фиксация больше не выполняется"""
+    if in_unit_of_work():
+        _unit_of_work.failed = True
+        Session().rollback()
+
+def end_unit_of_work():
+    """Завершение единицы работы: откат незафиксированных изменений и закрытие сессии"""
+    depth = getattr(_unit_of_work, 'depth', 0)
+    _unit_of_work.depth = max(depth - 1, 0)
+    if depth == 1:
+        Session.remove()
+
+@contextmanager
+def unit_of_work():
+    """Единица работы: одно соединение и одна транзакция на запрос или обновление"""
+    begin_unit_of_work()
+    try:
+        yield get_session()
+        commit_unit_of_work()
+    finally:
+        end_unit_of_work()
+
+def commit_session(session):
+    """Фиксация изменений сервиса; внутри единицы работы изменения только сбрасываются в БД"""
+    if in_unit_of_work():
+        session.flush()
+    else:
+        session.commit()
+
+def rollback_session(session):
+    """Откат изменений сервиса после ошибки; вызывается из блока except.
+
+    Внутри единицы работы откатывается вся ее транзакция, поэтому ошибка
+    пробрасывается дальше: запрос или обработчик не должен продолжаться,
+    как будто ничего не случилось.
+    """
+    if in_unit_of_work():
+        rollback_unit_of_work()
+        raise
+    session.rollback()
+
+def close_session(session):
+    """Закрытие сессии сервиса; внутри единицы работы ее закрывает сама единица работы"""
+    if not in_unit_of_work():
+        session.close()
+
+def run_after_commit(session, callback):
+    """Вызов callback после фиксации транзакции сессии (например, сброс кэша).
+
+    Вне единицы работы сервис уже зафиксировал изменения, и callback
+    вызывается сразу; внутри - после фиксации всей единицы работы,
+    чтобы кэш не заполнился данными, которые еще не видны другим соединениям.
+    """
+    if in_unit_of_work():
+        session.info.setdefault('after_commit', []).append(callback)
+    else:
+        callback()
+
+@event.listens_for(session_factory, 'after_commit')
+def run_after_commit_callbacks(session):
+    for callback in session.info.pop('after_commit', []):
+        callback()
+
+@event.listens_for(session_factory, 'after_rollback')
+def discard_after_commit_callbacks(session):
+    session.info.pop('after_commit', None)
+
+def register_unit_of_work(app):
+    """Подключение единицы работы к запросам Flask приложения"""
+    @app.before_request
+    def begin_request_unit_of_work():
+        begin_unit_of_work()
+
+    @app.after_request
+    def commit_request_unit_of_work(response):
+        # after_request вызывается и для необработанных исключений (ответ 500):
+        # фиксируются только успешные ответы. Фиксация идет до отправки ответа,
+        # чтобы ошибка записи вернула 500
+        if response.status_code < 500:
+            commit_unit_of_work()
+        return response
+
+    @app.teardown_request
+    def end_request_unit_of_work(error=None):
+        # Незафиксированная транзакция откатывается при закрытии сессии
+        if error is not None:
+            rollback_unit_of_work()
+        end_unit_of_work()
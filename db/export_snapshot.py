@@ -0,0 +1,233 @@
+import sys
+import os
+import json
+import uuid
+import shutil
+import argparse
+import logging
+from datetime import datetime
+from sqlalchemy import select
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.database import get_session, close_session
+from db.models import Report, User, Team
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Файл с отметкой последнего снимка внутри каталога выгрузки
+STATE_FILE = '_snapshot_state.json'
+
+# Размер пачки чтения из БД и записи в файл
+SNAPSHOT_BATCH_SIZE = 10000
+
+COLUMNS = (
+    'id', 'user_id', 'user_name', 'team_id', 'team_name', 'description',
+    'metric_name', 'metric_value', 'report_date', 'created_at', 'updated_at'
+)
+
+def get_schema(pa):
+    """Схема колонок снимка"""
+    return pa.schema([
+        ('id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('user_name', pa.string()),
+        ('team_id', pa.int64()),
+        ('team_name', pa.string()),
+        ('description', pa.string()),
+        ('metric_name', pa.string()),
+        ('metric_value', pa.float64()),
+        ('report_date', pa.timestamp('us')),
+        ('created_at', pa.timestamp('us')),
+        ('updated_at', pa.timestamp('us')),
+    ])
+
+def load_state(output_dir):
+    """Отметка updated_at последнего снимка или None"""
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        value = json.load(f).get('max_updated_at')
+    return datetime.fromisoformat(value) if value else None
+
+def replace_partitions(output_dir, staging_dir):
+    """Замена партиций и отметки снимка содержимым каталога полной выгрузки"""
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if name.startswith('team=') and os.path.isdir(path):
+            shutil.rmtree(path)
+        elif name == STATE_FILE:
+            os.remove(path)
+
+    for name in os.listdir(staging_dir):
+        os.replace(os.path.join(staging_dir, name), os.path.join(output_dir, name))
+    os.rmdir(staging_dir)
+
+def save_state(output_dir, max_updated_at):
+    """Сохранение отметки updated_at после успешного снимка"""
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path, 'w') as f:
+        json.dump({
+            'max_updated_at': max_updated_at.isoformat() if max_updated_at else None,
+            'snapshot_at': datetime.now().isoformat()
+        }, f)
+
+def iter_snapshot_rows(since=None, batch_size=SNAPSHOT_BATCH_SIZE):
+    """Потоковое чтение отчетов с пользователями и командами, упорядоченное по партициям"""
+    session = get_session()
+    try:
+        query = select(
+            Report.id,
+            Report.user_id,
+            User.name,
+            Report.team_id,
+            Team.name,
+            Report.description,
+            Report.metric_name,
+            Report.metric_value,
+            Report.report_date,
+            Report.created_at,
+            Report.updated_at
+        ).outerjoin(User, User.id == Report.user_id).outerjoin(Team, Team.id == Report.team_id)
+
+        if since:
+            query = query.where(Report.updated_at > since)
+
+        # Порядок по (team_id, report_date) совпадает с индексом и партициями
+        result = session.execute(
+            query.order_by(Report.team_id, Report.report_date, Report.id).execution_options(yield_per=batch_size)
+        )
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        close_session(session)
+
+class PartitionWriter:
+    """Запись снимка в партиции team=<id>/month=<YYYY-MM> пачками RecordBatch"""
+
+    def __init__(self, pa, output_dir, file_format, run_id, batch_size=SNAPSHOT_BATCH_SIZE):
+        self.pa = pa
+        self.schema = get_schema(pa)
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.files = 0
+        self.rows = 0
+        self._partition = None
+        self._writer = None
+        self._columns = {column: [] for column in COLUMNS}
+
+    def write(self, row):
+        team_id = row[3] or 0
+        month = row[8].strftime('%Y-%m') if row[8] else 'unknown'
+        if (team_id, month) != self._partition:
+            self._close_partition()
+            self._partition = (team_id, month)
+
+        for column, value in zip(COLUMNS, row):
+            self._columns[column].append(value)
+
+        if len(self._columns['id']) >= self.batch_size:
+            self._flush()
+
+    def close(self):
+        self._close_partition()
+
+    def _open_writer(self):
+        team_id, month = self._partition
+        directory = os.path.join(self.output_dir, f"team={team_id}", f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+
+        if self.file_format == 'parquet':
+            import pyarrow.parquet as pq
+            path = os.path.join(directory, f"part-{self.run_id}.parquet")
+            self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            import pyarrow.ipc as ipc
+            path = os.path.join(directory, f"part-{self.run_id}.arrow")
+            self._writer = ipc.new_file(path, self.schema)
+        self.files += 1
+
+    def _flush(self):
+        if not self._columns['id']:
+            return
+
+        if self._writer is None:
+            self._open_writer()
+
+        batch = self.pa.RecordBatch.from_pydict(self._columns, schema=self.schema)
+        if self.file_format == 'parquet':
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+
+        self.rows += batch.num_rows
+        self._columns = {column: [] for column in COLUMNS}
+
+    def _close_partition(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+def export_snapshot(output_dir, file_format='parquet', full=False):
+    """Снимок отчетов в колоночные файлы.
+
+    Без full выгружаются только отчеты, измененные после предыдущего снимка;
+    они дописываются новыми файлами part-<run_id> в те же партиции, поэтому
+    при чтении измененный отчет следует брать с наибольшим updated_at.
+    Удаленные отчеты в инкрементальный снимок не попадают: чтобы убрать их
+    из выгрузки, нужен полный снимок (full).
+
+    С full снимок пишется в отдельный каталог внутри output_dir и после
+    успешной записи заменяет все прежние партиции и отметку снимка, чтобы
+    старые файлы не дублировали отчеты.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        logger.error("Для выгрузки снимков установите pyarrow: pip install pyarrow")
+        return False
+
+    os.makedirs(output_dir, exist_ok=True)
+    since = None if full else load_state(output_dir)
+    # pid и случайный суффикс: запуски в одну секунду не перезаписывают файлы друг друга
+    run_id = f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    target_dir = os.path.join(output_dir, f".full-{run_id}") if full else output_dir
+    writer = PartitionWriter(pa, target_dir, file_format, run_id)
+    max_updated_at = since
+
+    try:
+        for row in iter_snapshot_rows(since=since):
+            writer.write(row)
+            updated_at = row[10]
+            if updated_at and (max_updated_at is None or updated_at > max_updated_at):
+                max_updated_at = updated_at
+    except Exception:
+        writer.close()
+        if full:
+            shutil.rmtree(target_dir, ignore_errors=True)
+        raise
+    writer.close()
+
+    if full:
+        os.makedirs(target_dir, exist_ok=True)
+        replace_partitions(output_dir, target_dir)
+    save_state(output_dir, max_updated_at)
+    logger.info(f"Снимок отчетов записан: {writer.rows} строк, {writer.files} файлов в {output_dir}")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Снимок отчетов в Parquet/Arrow для аналитики",
+        epilog="Инкрементальный запуск выгружает только новые и измененные отчеты; "
+               "удаления переносятся в выгрузку только полным снимком (--full)"
+    )
+    parser.add_argument('output_dir', help="Каталог выгрузки")
+    parser.add_argument('--format', choices=('parquet', 'arrow'), default='parquet', help="Формат файлов")
+    parser.add_argument('--full', action='store_true', help="Полная выгрузка без учета предыдущего снимка (учитывает удаленные отчеты)")
+    args = parser.parse_args()
+
+    sys.exit(0 if export_snapshot(args.output_dir, args.format, args.full) else 1)
@@ -1,6 +1,14 @@
-from models import init_db, get_session, User, Team
-from config.config import USER_ROLES
+import sys
+import os
 import logging
+from datetime import datetime, timezone
+from sqlalchemy import inspect, text, bindparam, DateTime
+from sqlalchemy.schema import CreateIndex
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.database import engine, init_db, get_session
+from db.models import User, Team, Report, REPORT_SEARCH_TABLE, REPORT_SEARCH_DDL
+from config.config import USER_ROLES
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -49,10 +57,71 @@ def create_default_team(session, name="Общая команда", description="
         logger.error(f"Ошибка при создании команды по умолчанию: {e}")
         return None
 
+def utc_to_local(value):
+    """Перевод наивного времени UTC в наивное локальное время"""
+    return value.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def get_index_names(engine, inspector, table_name):
+    """Имена индексов таблицы, включая индексы по выражениям"""
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            return set(connection.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {'table': table_name}
+            ).scalars())
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+def migrate_database(engine):
+    """Приведение существующей базы к актуальной схеме (повторный запуск безопасен)"""
+    inspector = inspect(engine)
+    report_columns = {column['name'] for column in inspector.get_columns(Report.__tablename__)}
+
+    with engine.begin() as connection:
+        # Добавление колонки report_date в старые базы
+        if 'report_date' not in report_columns:
+            connection.execute(text("ALTER TABLE reports ADD COLUMN report_date DATETIME"))
+            logger.info("Добавлена колонка reports.report_date")
+
+        # Заполнение даты отчета для всех записей без нее. created_at хранится в UTC,
+        # а report_date - в локальном времени, поэтому дата создания переводится в локальную.
+        # Значения передаются параметрами DateTime, чтобы формат строки совпадал с записями ORM
+        missing = connection.execute(
+            text("SELECT id, created_at FROM reports WHERE report_date IS NULL")
+            .columns(created_at=DateTime)
+        ).all()
+        if missing:
+            connection.execute(
+                text("UPDATE reports SET report_date = :report_date WHERE id = :id")
+                .bindparams(bindparam('report_date', type_=DateTime)),
+                [
+                    {'id': report_id, 'report_date': utc_to_local(created_at) if created_at else datetime.now()}
+                    for report_id, created_at in missing
+                ]
+            )
+            logger.info(f"Заполнена дата отчета у {len(missing)} записей")
+
+    # Создание недостающих индексов. Индексы по выражениям инспектор SQLite не возвращает,
+    # поэтому их имена берутся из sqlite_master, а создание защищено IF NOT EXISTS
+    for table in (User.__table__, Report.__table__):
+        existing_indexes = get_index_names(engine, inspector, table.name)
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                with engine.begin() as connection:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+                logger.info(f"Создан индекс {index.name}")
+
+    # Полнотекстовый индекс описаний для баз, созданных до его появления
+    if engine.dialect.name == 'sqlite' and not inspector.has_table(REPORT_SEARCH_TABLE):
+        with engine.begin() as connection:
+            for statement in REPORT_SEARCH_DDL:
+                connection.execute(text(statement))
+            connection.execute(text(f"INSERT INTO {REPORT_SEARCH_TABLE}({REPORT_SEARCH_TABLE}) VALUES ('rebuild')"))
+        logger.info(f"Создан полнотекстовый индекс {REPORT_SEARCH_TABLE}")
+
 def initialize_database():
     """Инициализация базы данных с начальными данными"""
     try:
-        engine = init_db()
+        init_db()
         session = get_session()
         logger.info("База данных успешно инициализирована")
         
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Enum
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, Float, Enum, Index, DDL, event, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -17,7 +17,7 @@ class User(Base):
     telegram_id = Column(Integer, unique=True, nullable=False)
     name = Column(String(100), nullable=False)
     role = Column(Enum(UserRole), default=UserRole.EMPLOYEE)
-    team_id = Column(Integer, ForeignKey('teams.id'))
+    team_id = Column(Integer, ForeignKey('teams.id'), index=True)
     registration_date = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -76,12 +76,95 @@ class Report(Base):
     description = Column(Text, nullable=False)
     metric_name = Column(String(100), nullable=True)
     metric_value = Column(Float, nullable=True)
+    # Дата отчета в локальном времени, как и периоды в ReportService
+    report_date = Column(DateTime, default=datetime.now)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Индексы для выборок по пользователю/команде за период
+    __table_args__ = (
+        Index('ix_reports_user_id_report_date', 'user_id', 'report_date'),
+        Index('ix_reports_team_id_report_date', 'team_id', 'report_date'),
+        Index('ix_reports_report_date', 'report_date'),
+    )
+
     # Отношения
     user = relationship("User", back_populates="reports")
     team = relationship("Team", back_populates="reports")
 
     def __repr__(self):
-        return f"<Report {self.id} created at {self.created_at}>" 
\ No newline at end of file
+        return f"<Report {self.id} created at {self.created_at}>"
+
+# Дата для постраничной истории: report_date, а если она не заполнена - created_at.
+# Индекс по тому же выражению позволяет искать страницу без OFFSET и сортировки
+REPORT_SORT_DATE = func.coalesce(Report.report_date, Report.created_at)
+Index('ix_reports_user_id_sort_date', Report.user_id, REPORT_SORT_DATE)
+
+# Полнотекстовый индекс описаний отчетов (SQLite FTS5).
+# Таблица хранит только индекс, тексты берутся из reports; триггеры
+# синхронизируют его при любых изменениях, включая массовую вставку
+REPORT_SEARCH_TABLE = 'reports_fts'
+
+REPORT_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5("
+    "description, content='reports', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS reports_fts_insert AFTER INSERT ON reports BEGIN "
+    "INSERT INTO reports_fts(rowid, description) VALUES (new.id, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS reports_fts_delete AFTER DELETE ON reports BEGIN "
+    "INSERT INTO reports_fts(reports_fts, rowid, description) VALUES ('delete', old.id, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS reports_fts_update AFTER UPDATE OF description ON reports BEGIN "
+    "INSERT INTO reports_fts(reports_fts, rowid, description) VALUES ('delete', old.id, old.description); "
+    "INSERT INTO reports_fts(rowid, description) VALUES (new.id, new.description); END",
+)
+
+for statement in REPORT_SEARCH_DDL:
+    event.listen(Report.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+class MetricDailyRollup(Base):
+    """Дневные агрегаты показателей из отчетов"""
+    __tablename__ = 'metric_daily_rollup'
+
+    # Для отчетов без команды или пользователя используется 0
+    team_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    metric_name = Column(String(100), primary_key=True)
+    day = Column(Date, primary_key=True)
+    value_count = Column(Integer, nullable=False, default=0)
+    value_sum = Column(Float, nullable=False, default=0)
+    value_min = Column(Float, nullable=True)
+    value_max = Column(Float, nullable=True)
+
+    # Индексы для статистики по команде/пользователю за период
+    __table_args__ = (
+        Index('ix_metric_daily_rollup_team_id_day', 'team_id', 'day'),
+        Index('ix_metric_daily_rollup_user_id_day', 'user_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f"<MetricDailyRollup {self.metric_name} {self.day}: {self.value_count}>"
+
+class WeeklySummary(Base):
+    """Готовая сводка за неделю, общая для процессов бота и веб-приложения"""
+    __tablename__ = 'weekly_summaries'
+
+    # Для сводки по всем командам используется 0
+    team_id = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(Text, nullable=False)  # JSON строка с данными сводки
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<WeeklySummary team {self.team_id} at {self.created_at}>"
+
+class BotState(Base):
+    """Состояние диалога пользователя с ботом (FSM)"""
+    __tablename__ = 'bot_states'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    state = Column(String(100), nullable=True)
+    data = Column(Text, nullable=False, default='{}')  # JSON строка с данными диалога
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<BotState {self.chat_id}/{self.user_id}: {self.state}>"
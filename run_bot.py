@@ -1,10 +1,14 @@
 import os
 import sys
-from bot.telegram_bot import start_bot
 from db.database import init_db
+from bot.server import SERVER_MODE, run_production_server
 
 if __name__ == '__main__':
     # Инициализируем базу данных
     init_db()
-    # Запускаем бота
-    start_bot() 
\ No newline at end of file
+    # Запускаем бота: production - gunicorn, иначе отладочные серверы Flask
+    if SERVER_MODE == 'production':
+        sys.exit(0 if run_production_server() else 1)
+    else:
+        from bot.telegram_bot import start_bot
+        start_bot()
\ No newline at end of file
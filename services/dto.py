@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+
+# Неизменяемые снимки моделей, которые возвращает слой сервисов.
+# Они не привязаны к сессии, поэтому их можно кэшировать, передавать
+# между потоками и отображать в шаблонах без скрытых запросов к БД.
+
+@dataclass(frozen=True)
+class TeamDTO:
+    """Снимок команды"""
+    __slots__ = ('id', 'name', 'description')
+
+    id: int
+    name: str
+    description: str
+
+    @classmethod
+    def from_model(cls, team):
+        if team is None:
+            return None
+        return cls(id=team.id, name=team.name, description=team.description)
+
+@dataclass(frozen=True)
+class UserDTO:
+    """Снимок пользователя вместе с его командой"""
+    __slots__ = ('id', 'telegram_id', 'name', 'role', 'team_id', 'team')
+
+    id: int
+    telegram_id: int
+    name: str
+    role: object
+    team_id: int
+    team: TeamDTO
+
+    @classmethod
+    def from_model(cls, user):
+        """Команда должна быть загружена заранее (joinedload/selectinload)"""
+        if user is None:
+            return None
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            name=user.name,
+            role=user.role,
+            team_id=user.team_id,
+            team=TeamDTO.from_model(user.team)
+        )
+
+@dataclass(frozen=True)
+class ReportDTO:
+    """Снимок отчета с именем автора и названием команды"""
+    __slots__ = (
+        'id', 'user_id', 'team_id', 'description', 'metric_name', 'metric_value',
+        'report_date', 'created_at', 'user_name', 'team_name'
+    )
+
+    id: int
+    user_id: int
+    team_id: int
+    description: str
+    metric_name: str
+    metric_value: float
+    report_date: object
+    created_at: object
+    user_name: str
+    team_name: str
+
+    @classmethod
+    def from_model(cls, report):
+        """Автор и команда должны быть загружены заранее (joinedload/selectinload)"""
+        if report is None:
+            return None
+        return cls(
+            id=report.id,
+            user_id=report.user_id,
+            team_id=report.team_id,
+            description=report.description,
+            metric_name=report.metric_name,
+            metric_value=report.metric_value,
+            report_date=report.report_date,
+            created_at=report.created_at,
+            user_name=report.user.name if report.user else None,
+            team_name=report.team.name if report.team else None
+        )
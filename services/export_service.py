@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+import zlib
+
+# Колонки экспорта отчетов в порядке вывода
+EXPORT_COLUMNS = ('id', 'report_date', 'team_name', 'user_name', 'description', 'metric_name', 'metric_value')
+
+# Число строк, накапливаемых перед отправкой очередного фрагмента ответа
+EXPORT_CHUNK_ROWS = 500
+
+class ExportService:
+    """Потоковое кодирование отчетов в CSV/JSONL с необязательным сжатием gzip"""
+
+    @staticmethod
+    def _format_value(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def iter_csv(rows, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Кодирование строк в CSV фрагментами по chunk_rows строк"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+
+        count = 0
+        for row in rows:
+            writer.writerow([ExportService._format_value(value) for value in row])
+            count += 1
+            if count % chunk_rows == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate(0)
+
+        yield buffer.getvalue().encode('utf-8')
+
+    @staticmethod
+    def iter_jsonl(rows, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Кодирование строк в JSON Lines фрагментами по chunk_rows строк"""
+        lines = []
+        for row in rows:
+            record = {
+                column: ExportService._format_value(value)
+                for column, value in zip(EXPORT_COLUMNS, row)
+            }
+            lines.append(json.dumps(record, ensure_ascii=False))
+            if len(lines) == chunk_rows:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
+
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+    @staticmethod
+    def iter_gzip(chunks, level=6):
+        """Сжатие потока фрагментов в формат gzip на лету"""
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 - заголовок gzip
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
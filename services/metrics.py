@@ -0,0 +1,305 @@
+import os
+import re
+import hmac
+import time
+import logging
+import threading
+import functools
+from bisect import bisect_left
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Сбор метрик и эндпоинт /metrics. С METRICS_TOKEN эндпоинт требует заголовок
+# Authorization: Bearer <токен>, без него отвечает только локальным запросам не через прокси
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Запросы к БД дольше SLOW_QUERY_MS миллисекунд пишутся в лог (0 - не писать)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+
+# Границы корзин гистограмм длительности в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_PREFIX = 'report_bot'
+
+# Адреса, которым /metrics доступен без токена
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+# Первое слово SQL-запроса: SELECT, INSERT, UPDATE, ...
+SQL_OPERATION_PATTERN = re.compile(r'^\s*(\w+)')
+
+def format_labels(labels):
+    """Метки в формате Prometheus: {name="value",...}"""
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Счетчик с метками"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(zip(self.labelnames, key))} {format_value(value)}")
+        return lines
+
+class Histogram:
+    """Гистограмма длительностей с метками и фиксированными корзинами"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [счетчики корзин (последняя - +Inf), сумма]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(labels + [('le', format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Метрики процесса в текстовом формате Prometheus.
+
+    Кроме собственных счетчиков и гистограмм, при выводе опрашиваются
+    методы stats() компонентов (очереди, кэши, лимиты): их числовые поля
+    становятся метриками-измерителями с метками компонента.
+    """
+
+    def __init__(self, prefix=METRIC_PREFIX):
+        self.prefix = prefix
+        self._metrics = {}
+        self._sources = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(f"{self.prefix}_{name}", documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        # Повторная регистрация возвращает уже созданную метрику
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def register_stats(self, name, stats, **labels):
+        """Опрос stats() компонента при выводе метрик: поле key -> <prefix>_<name>_<key>{labels}"""
+        with self._lock:
+            self._sources = [
+                source for source in self._sources if (source[0], source[2]) != (name, labels)
+            ]
+            self._sources.append((name, stats, labels))
+
+    def _collect_stats(self):
+        with self._lock:
+            sources = list(self._sources)
+
+        families = {}
+        for name, stats, labels in sources:
+            try:
+                values = stats()
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик {name}: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric_name = f"{self.prefix}_{name}_{key}"
+                families.setdefault(metric_name, []).append(
+                    f"{metric_name}{format_labels(sorted(labels.items()))} {format_value(value)}"
+                )
+
+        lines = []
+        for metric_name, samples in sorted(families.items()):
+            lines.append(f"# TYPE {metric_name} gauge")
+            lines.extend(samples)
+        return lines
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        lines.extend(self._collect_stats())
+        return '\n'.join(lines) + '\n'
+
+# Метрики процесса (при нескольких воркерах gunicorn у каждого свои)
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    'http_request_duration_seconds', 'Длительность HTTP-запросов', ('app', 'endpoint', 'method', 'status')
+)
+db_query_duration = metrics.histogram(
+    'db_query_duration_seconds', 'Длительность запросов к базе данных', ('operation',)
+)
+db_slow_queries = metrics.counter(
+    'db_slow_queries_total', 'Запросы к базе данных дольше SLOW_QUERY_MS', ('operation',)
+)
+handler_duration = metrics.histogram(
+    'handler_duration_seconds', 'Длительность обработчиков бота', ('handler',)
+)
+handler_errors = metrics.counter(
+    'handler_errors_total', 'Исключения в обработчиках бота', ('handler',)
+)
+
+def instrument_engine(engine, slow_query_ms=SLOW_QUERY_MS):
+    """Замер длительности каждого запроса SQLAlchemy и журнал медленных запросов"""
+    from sqlalchemy import event
+
+    if not METRICS_ENABLED or engine.__dict__.get('_metrics_instrumented'):
+        return
+    engine._metrics_instrumented = True
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def observe_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        elapsed = time.perf_counter() - started
+        match = SQL_OPERATION_PATTERN.match(statement)
+        operation = match.group(1).upper() if match else 'OTHER'
+        db_query_duration.observe(elapsed, operation=operation)
+
+        if slow_query_ms and elapsed * 1000 >= slow_query_ms:
+            db_slow_queries.inc(operation=operation)
+            logger.warning(f"Медленный запрос ({elapsed * 1000:.1f} мс): {' '.join(statement.split())[:500]}")
+
+    @event.listens_for(engine, 'handle_error')
+    def discard_query_timer(exception_context):
+        # Запрос завершился ошибкой: after_cursor_execute не вызывается
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_started'):
+            connection.info['query_started'].pop()
+
+def instrument_flask(app, name):
+    """Замер длительности запросов Flask приложения"""
+    from flask import g, request
+
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                app=name,
+                # Шаблон маршрута, а не путь: число рядов метрики не растет с числом URL
+                endpoint=request.endpoint or 'unknown',
+                method=request.method,
+                status=response.status_code
+            )
+        return response
+
+def is_local_request(request):
+    """Запрос с этой же машины напрямую, а не через обратный прокси"""
+    # За прокси remote_addr - адрес прокси, поэтому запросы с X-Forwarded-For локальными не считаются
+    return request.remote_addr in LOCAL_ADDRESSES and 'X-Forwarded-For' not in request.headers
+
+def register_metrics_endpoint(app, path='/metrics'):
+    """Эндпоинт метрик в текстовом формате Prometheus.
+
+    С METRICS_TOKEN нужен заголовок Authorization: Bearer <токен>,
+    без токена метрики отдаются только локальным запросам.
+    """
+    from flask import Response, request, abort
+
+    if not METRICS_ENABLED:
+        return
+
+    def metrics_endpoint():
+        if METRICS_TOKEN:
+            if not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                       f"Bearer {METRICS_TOKEN}".encode()):
+                abort(403)
+        elif not is_local_request(request):
+            abort(403)
+        return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    app.add_url_rule(path, 'metrics', metrics_endpoint)
+
+def timed_handler(function):
+    """Обертка обработчика бота с замером длительности и подсчетом исключений"""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            handler_errors.inc(handler=name)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, handler=name)
+
+    return wrapper
+
+def instrument_handlers(bot):
+    """Замер длительности всех зарегистрированных обработчиков бота.
+
+    Вызывается после объявления обработчиков; сигнатура сохраняется
+    через functools.wraps, поэтому передача data/bot в telebot не меняется.
+    """
+    if not METRICS_ENABLED:
+        return
+
+    for handlers in (bot.message_handlers, bot.callback_query_handlers):
+        for handler in handlers:
+            if not hasattr(handler['function'], '__wrapped__'):
+                handler['function'] = timed_handler(handler['function'])
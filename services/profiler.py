@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Интервал выборки стеков в секундах, предельная длительность профилирования
+# и каталог, куда сохраняются результаты (пусто - не сохранять)
+PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', '0.005'))
+PROFILER_MAX_SECONDS = int(os.getenv('PROFILER_MAX_SECONDS', '120'))
+PROFILER_OUTPUT_DIR = os.getenv('PROFILER_OUTPUT_DIR', 'profiles')
+
+# Кадры "файл:функция", на которых потоки ждут работы: очереди, блокировки, сокеты.
+# Сами блокирующие вызовы (acquire, select, recv) написаны на C и в стеке не видны,
+# поэтому вершиной стека ожидающего потока оказывается вызвавшая их функция
+IDLE_FUNCTIONS = frozenset((
+    'threading.py:wait',
+    'threading.py:_wait_for_tstate_lock',
+    'queue.py:get',
+    'selectors.py:select',
+    'socket.py:accept',
+    'socket.py:readinto',
+    'ssl.py:read',
+    'ssl.py:recv_into',
+    'socketserver.py:serve_forever',
+))
+
+def format_frame(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class ProfileRun:
+    """Результат одного запуска профилирования.
+
+    Каждый запуск копит свои стеки, поэтому результат, полученный из
+    start(), не меняется от последующих запусков.
+    """
+
+    def __init__(self, seconds, requests=None):
+        self.seconds = seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self.requests_left = requests if requests and requests > 0 else None
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def wait(self, timeout=None):
+        """Ожидание завершения профилирования"""
+        return self._done.wait(timeout)
+
+    def add_sample(self, stacks):
+        with self._lock:
+            self.stacks.update(stacks)
+            self.samples += 1
+
+    def note_request(self):
+        """Учет обработанного запроса; True, если достигнуто ограничение по числу запросов"""
+        with self._lock:
+            if self.requests_left is None:
+                return False
+            self.requests_left -= 1
+            return self.requests_left <= 0
+
+    def finish(self):
+        with self._lock:
+            self.finished_at = time.monotonic()
+        self._done.set()
+
+    def collapsed(self, include_idle=False):
+        """Свернутые стеки для flamegraph: одна строка "стек число" на стек.
+
+        Потоки, ожидающие работы (очереди, блокировки, сокеты), по умолчанию
+        пропускаются, чтобы не заслонять полезную нагрузку.
+        """
+        with self._lock:
+            stacks = dict(self.stacks)
+        lines = [
+            f"{stack} {count}"
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1])
+            if include_idle or not self._is_idle(stack)
+        ]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    @staticmethod
+    def _is_idle(stack):
+        return stack.rsplit(';', 1)[-1] in IDLE_FUNCTIONS
+
+    def top(self, limit=15):
+        """Функции, чаще всего находившиеся на вершине стека (без ожидающих потоков)"""
+        with self._lock:
+            stacks = dict(self.stacks)
+        leaves = Counter()
+        for stack, count in stacks.items():
+            if not self._is_idle(stack):
+                leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values())
+        return [(frame, count, count / total) for frame, count in leaves.most_common(limit)]
+
+    def status(self):
+        """Состояние запуска"""
+        with self._lock:
+            finished_at = self.finished_at or time.monotonic()
+            return {
+                'active': not self._done.is_set(),
+                'samples': self.samples,
+                'stacks': len(self.stacks),
+                'requests_left': self.requests_left,
+                'elapsed': round(finished_at - self.started_at, 3)
+            }
+
+    def save(self, output_dir=PROFILER_OUTPUT_DIR):
+        """Сохранение свернутых стеков в файл, возвращает путь или None"""
+        if not output_dir:
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.collapsed")
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+        return path
+
+    def format_top(self, limit=15):
+        """Текст самых затратных функций для сообщения бота"""
+        status = self.status()
+        lines = [f"Профиль: {status['samples']} выборок за {status['elapsed']} с", ""]
+        top = self.top(limit)
+        if not top:
+            lines.append("Активной работы не обнаружено.")
+        for frame, count, share in top:
+            lines.append(f"{share:6.1%}  {frame} ({count})")
+        return "\n".join(lines)
+
+class SamplingProfiler:
+    """Выборочный профилировщик всех потоков процесса.
+
+    Пока профилирование выключено, он ничего не стоит: нет ни хуков
+    sys.setprofile, ни фонового потока. Во время работы отдельный поток
+    каждые interval секунд снимает стеки всех потоков (sys._current_frames)
+    и считает одинаковые стеки в ProfileRun текущего запуска. Результат -
+    свернутые стеки ("поток;модуль:функция;... число"), которые принимают
+    flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL, max_seconds=PROFILER_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        # Проверяется на горячем пути, поэтому это простой атрибут
+        self.active = False
+        self._current = None
+        self._lock = threading.Lock()
+
+    def start(self, seconds=10, requests=None, on_complete=None):
+        """Запуск профилирования на seconds секунд или до requests обработанных запросов.
+
+        Возвращает ProfileRun этого запуска или None, если профилирование уже идет.
+        on_complete(run) вызывается в потоке профилировщика после завершения.
+        """
+        seconds = max(1, min(seconds, self.max_seconds))
+        with self._lock:
+            if self.active:
+                return None
+            run = self._current = ProfileRun(seconds, requests)
+            self.active = True
+            threading.Thread(target=self._run, args=(run, on_complete), name="profiler", daemon=True).start()
+        logger.info(f"Профилирование запущено: {seconds} с, запросов: {requests or 'без ограничения'}")
+        return run
+
+    def stop(self):
+        """Досрочная остановка профилирования"""
+        self.active = False
+
+    def note_request(self):
+        """Учет обработанного запроса или обновления для ограничения по числу запросов"""
+        if not self.active:
+            return
+        run = self._current
+        if run is not None and run.note_request():
+            self.active = False
+
+    def _run(self, run, on_complete):
+        own_id = threading.get_ident()
+        deadline = run.started_at + run.seconds
+        names = {}
+        try:
+            while self.active and time.monotonic() < deadline:
+                for thread in threading.enumerate():
+                    names[thread.ident] = thread.name
+
+                stacks = []
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(format_frame(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    stacks.append(';'.join(reversed(stack)))
+
+                run.add_sample(stacks)
+                time.sleep(self.interval)
+        except Exception as e:
+            logger.error(f"Ошибка при профилировании: {e}")
+        finally:
+            with self._lock:
+                self.active = False
+            run.finish()
+            logger.info(f"Профилирование завершено: {run.samples} выборок")
+
+        if on_complete:
+            try:
+                on_complete(run)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке результата профилирования: {e}")
+
+# Профилировщик процесса (при нескольких воркерах gunicorn у каждого свой)
+profiler = SamplingProfiler()
+
+def register_profiler_endpoint(app, is_admin, path='/admin/profile'):
+    """Эндпоинт профилирования для администраторов.
+
+    GET path?seconds=10&requests=100 запускает профилирование, ждет его
+    завершения и возвращает свернутые стеки; idle=1 оставляет ожидающие
+    потоки, format=top - список самых затратных функций. Каждый
+    обработанный запрос приложения учитывается в ограничении requests.
+    """
+    from flask import Response, request, jsonify
+    from db.database import commit_unit_of_work
+
+    @app.after_request
+    def count_profiled_request(response):
+        profiler.note_request()
+        return response
+
+    def profile_endpoint():
+        if not is_admin():
+            return jsonify({'status': 'error', 'message': 'Доступ только для администраторов'}), 403
+
+        seconds = request.args.get('seconds', 10, type=int)
+        run = profiler.start(seconds=seconds, requests=request.args.get('requests', type=int))
+        if run is None:
+            return jsonify({'status': 'error', 'message': 'Профилирование уже запущено'}), 409
+        # Ожидание длится до PROFILER_MAX_SECONDS: соединение запроса возвращается в пул заранее
+        commit_unit_of_work()
+        run.wait()
+        run.save()
+
+        if request.args.get('format') == 'top':
+            return jsonify({
+                'status': 'success',
+                'profile': run.status(),
+                'top': [{'frame': frame, 'samples': count, 'share': round(share, 4)}
+                        for frame, count, share in run.top()]
+            })
+        collapsed = run.collapsed(include_idle=request.args.get('idle') == '1')
+        return Response(collapsed, content_type='text/plain; charset=utf-8')
+
+    app.add_url_rule(path, 'admin_profile', profile_endpoint)
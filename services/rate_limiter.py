@@ -0,0 +1,193 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def parse_rate_limit(value):
+    """Разбор лимита вида '<запросов>/<секунд>' в пару (емкость, пополнение в секунду).
+
+    Пустое значение или 0 отключают ограничение.
+    """
+    if not value:
+        return None
+    requests_count, _, period = value.partition('/')
+    requests_count, period = float(requests_count), float(period or 60)
+    if requests_count <= 0 or period <= 0:
+        return None
+    return requests_count, requests_count / period
+
+# Лимиты запросов по ролям; DEFAULT действует для незарегистрированных пользователей
+RATE_LIMITS = {
+    'DEFAULT': parse_rate_limit(os.getenv('RATE_LIMIT_DEFAULT', '10/60')),
+    'EMPLOYEE': parse_rate_limit(os.getenv('RATE_LIMIT_EMPLOYEE', '30/60')),
+    'MANAGER': parse_rate_limit(os.getenv('RATE_LIMIT_MANAGER', '60/60')),
+    'ADMIN': parse_rate_limit(os.getenv('RATE_LIMIT_ADMIN', '120/60'))
+}
+
+# Число отслеживаемых пользователей в памяти и файл SQLite общего хранилища (пусто - в памяти)
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB')
+
+def get_role_name(role):
+    """Название роли для выбора лимита (UserRole, строка или None)"""
+    if role is None:
+        return 'DEFAULT'
+    return str(getattr(role, 'name', role)).upper()
+
+class TokenBucketLimiter:
+    """Ограничение частоты запросов алгоритмом token bucket с хранением в памяти процесса"""
+
+    def __init__(self, limits=None, maxsize=RATE_LIMIT_MAX_KEYS):
+        self.limits = limits if limits is not None else RATE_LIMITS
+        self.maxsize = maxsize
+        self.allowed = 0
+        self.rejected = 0
+        self.rejected_by_role = {}
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_limit(self, role):
+        role_name = get_role_name(role)
+        return role_name, self.limits.get(role_name, self.limits.get('DEFAULT'))
+
+    def _count(self, role_name, allowed):
+        if allowed:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+            self.rejected_by_role[role_name] = self.rejected_by_role.get(role_name, 0) + 1
+        return allowed
+
+    @staticmethod
+    def _refill(limit, tokens, updated_at, now):
+        capacity, rate = limit
+        return min(capacity, tokens + (now - updated_at) * rate)
+
+    def allow(self, key, role=None):
+        """Списание одного токена для key; False, если лимит исчерпан"""
+        role_name, limit = self._get_limit(role)
+        with self._lock:
+            if limit is None:
+                return self._count(role_name, True)
+
+            now = time.monotonic()
+            bucket = self._buckets.get(key)
+            tokens = limit[0] if bucket is None else self._refill(limit, bucket[0], bucket[1], now)
+
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            self._buckets.move_to_end(key)
+            # Вытесненный пользователь просто начнет с полного запаса токенов
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return self._count(role_name, allowed)
+
+    def stats(self):
+        """Число пропущенных и отклоненных запросов"""
+        with self._lock:
+            return {
+                'keys': len(self._buckets),
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'rejected_by_role': dict(self.rejected_by_role)
+            }
+
+class SQLiteTokenBucketLimiter(TokenBucketLimiter):
+    """Token bucket в файле SQLite, общий для нескольких процессов"""
+
+    def __init__(self, path, limits=None, maxsize=RATE_LIMIT_MAX_KEYS):
+        super().__init__(limits=limits, maxsize=maxsize)
+        self._checks = 0
+        # Очистка полностью пополненных корзин выполняется раз в десятую часть емкости
+        self._prune_every = max(1, maxsize // 10)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def allow(self, key, role=None):
+        """Списание одного токена для key; False, если лимит исчерпан"""
+        role_name, limit = self._get_limit(role)
+        with self._lock:
+            if limit is None:
+                return self._count(role_name, True)
+
+            # Время стены, так как корзины общие для процессов
+            now = time.time()
+            key = str(key)
+            # BEGIN IMMEDIATE не дает другому процессу прочитать корзину до нашей записи
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = limit[0] if row is None else self._refill(limit, row[0], row[1], now)
+
+                allowed = tokens >= 1
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens - 1 if allowed else tokens, now)
+                )
+
+                self._checks += 1
+                if self._checks % self._prune_every == 0:
+                    self._prune(now)
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            return self._count(role_name, allowed)
+
+    def _prune(self, now):
+        # Корзина, не тронутая дольше самого длинного периода, уже полная - ее можно забыть
+        periods = [capacity / rate for capacity, rate in filter(None, self.limits.values())]
+        self._connection.execute(
+            "DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - max(periods, default=0),)
+        )
+
+    def stats(self):
+        """Число пропущенных и отклоненных запросов этого процесса"""
+        with self._lock:
+            keys = self._connection.execute("SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+            return {
+                'keys': keys,
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'rejected_by_role': dict(self.rejected_by_role)
+            }
+
+def create_rate_limiter(path=RATE_LIMIT_DB, limits=None, maxsize=RATE_LIMIT_MAX_KEYS):
+    """Создание ограничителя: в SQLite, если указан путь, иначе в памяти"""
+    if path:
+        logger.info(f"Лимиты запросов хранятся в {path}")
+        return SQLiteTokenBucketLimiter(path, limits=limits, maxsize=maxsize)
+    return TokenBucketLimiter(limits=limits, maxsize=maxsize)
+
+def rate_limited(limiter, identify):
+    """Декоратор маршрута Flask с ограничением частоты запросов.
+
+    identify() возвращает пару (telegram_id, роль) или None, если запрос
+    нельзя отнести к пользователю - такие запросы не ограничиваются.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import jsonify
+
+            identity = identify()
+            if identity is not None:
+                telegram_id, role = identity
+                if not limiter.allow(telegram_id, role):
+                    logger.warning(f"Превышен лимит запросов: пользователь {telegram_id}")
+                    return jsonify({'success': False, 'error': 'Too many requests'}), 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
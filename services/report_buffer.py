@@ -0,0 +1,152 @@
+import sys
+import os
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.database import commit_unit_of_work
+from services.report_service import ReportService
+from services.metrics import metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Максимальный размер пачки, задержка записи в секундах и время ожидания подтверждения
+REPORT_BATCH_SIZE = int(os.getenv('REPORT_BATCH_SIZE', '100'))
+REPORT_BATCH_DELAY = float(os.getenv('REPORT_BATCH_DELAY', '0.05'))
+REPORT_ACK_TIMEOUT = float(os.getenv('REPORT_ACK_TIMEOUT', '10'))
+
+class ReportWriteBuffer:
+    """Буфер отложенной записи отчетов с групповой фиксацией.
+
+    Отчеты накапливаются и записываются одной транзакцией, когда набирается
+    batch_size штук или с момента поступления первого из них проходит
+    max_delay секунд. submit() возвращает Future, который завершается
+    после фиксации транзакции.
+    """
+
+    def __init__(self, write_batch, batch_size=100, max_delay=0.05):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._counters = {'submitted': 0, 'written': 0, 'failed': 0, 'batches': 0}
+
+    def start(self):
+        """Запуск фонового потока записи (повторный вызов ничего не делает)"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, report):
+        """Постановка отчета в очередь записи, возвращает Future подтверждения.
+
+        Недопустимый отчет отклоняется сразу (ValueError), чтобы не сорвать
+        запись всей пачки.
+        """
+        report = ReportService.validate_report(report)
+        if self._thread is None:
+            self.start()
+
+        future = Future()
+        with self._condition:
+            self._pending.append((report, future, time.monotonic()))
+            self._counters['submitted'] += 1
+            self._condition.notify()
+        return future
+
+    def submit_and_wait(self, report, timeout=REPORT_ACK_TIMEOUT):
+        """Постановка отчета в очередь и ожидание фиксации его пачки.
+
+        Перед ожиданием фиксируется транзакция текущей единицы работы, и ее
+        соединение возвращается в пул: иначе запросы, ждущие записи, могут
+        занять весь пул, и потоку записи не достанется соединения.
+        """
+        future = self.submit(report)
+        commit_unit_of_work()
+        return future.result(timeout=timeout)
+
+    def stop(self, timeout=None):
+        """Запись оставшихся отчетов и остановка потока"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        """Счетчики записи и текущий размер буфера"""
+        with self._condition:
+            stats = dict(self._counters)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending and not self._stopped:
+                self._condition.wait()
+
+            if not self._pending:
+                return None
+
+            # Ждем заполнения пачки, но не дольше max_delay с первого отчета
+            deadline = self._pending[0][2] + self.max_delay
+            while len(self._pending) < self.batch_size and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            results = [self._write([report for report, _, _ in batch])] * len(batch)
+            if not results[0] and len(batch) > 1:
+                # Пачка не записалась: по одному, чтобы ошибка коснулась только плохого отчета
+                logger.warning(f"Пачка из {len(batch)} отчетов не записана, запись по одному")
+                results = [self._write([report]) for report, _, _ in batch]
+
+            with self._condition:
+                self._counters['batches'] += 1
+                self._counters['written'] += sum(results)
+                self._counters['failed'] += len(results) - sum(results)
+
+            for (_, future, _), written in zip(batch, results):
+                if written:
+                    future.set_result(True)
+                else:
+                    future.set_exception(RuntimeError("Не удалось сохранить отчет"))
+
+    def _write(self, reports):
+        """Запись отчетов одной транзакцией, True при успехе"""
+        try:
+            return self.write_batch(reports) is not None
+        except Exception as e:
+            logger.error(f"Ошибка при записи пачки отчетов: {e}")
+            return False
+
+# Общий буфер записи отчетов для веб-приложения и бота
+report_buffer = ReportWriteBuffer(
+    ReportService.create_reports_bulk,
+    batch_size=REPORT_BATCH_SIZE,
+    max_delay=REPORT_BATCH_DELAY
+)
+
+metrics.register_stats('report_buffer', report_buffer.stats)
@@ -1,18 +1,54 @@
 import sys
 import os
+import math
+import json
 import logging
 from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, insert, select
+from sqlalchemy.orm import joinedload
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db.models import Report, User, Team
-from db.database import get_session
+from db.models import Report, User, Team, WeeklySummary, REPORT_SORT_DATE
+from db.database import get_session, commit_session, rollback_session, close_session, run_after_commit
+from services.dto import ReportDTO
+from services.rollup_service import RollupService
+from services.cache import TTLCache
+from services.metrics import metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Размер пачки строк при потоковом чтении отчетов
+SUMMARY_BATCH_SIZE = 1000
+
+# Размер пачки строк при потоковом экспорте
+EXPORT_BATCH_SIZE = 1000
+
+# Размер страницы истории отчетов и его верхняя граница
+REPORTS_PAGE_SIZE = 20
+MAX_REPORTS_PAGE_SIZE = 100
+
+# Время жизни готовых еженедельных сводок в секундах
+SUMMARY_CACHE_TTL = int(os.getenv('SUMMARY_CACHE_TTL', '3600'))
+
 class ReportService:
     """Сервис для работы с отчетами сотрудников"""
 
+    # Готовые сводки за неделю по ID команды (None - все команды).
+    # Кэш свой в каждом процессе: записи этого процесса сбрасывают его сразу,
+    # записи других процессов становятся видны через SUMMARY_CACHE_TTL секунд.
+    # Сводки, рассчитанные заранее, дополнительно хранятся в таблице
+    # weekly_summaries, чтобы их видели и бот, и веб-приложение
+    _summary_cache = TTLCache(maxsize=1024, ttl=SUMMARY_CACHE_TTL)
+
+    @staticmethod
+    def _query_reports(session):
+        """Запрос отчетов вместе с именем автора и названием команды"""
+        return session.query(Report).options(
+            joinedload(Report.user).load_only(User.name),
+            joinedload(Report.team).load_only(Team.name)
+        )
+
     @staticmethod
     def create_report(user_id, team_id, description, metric_value=None, metric_name=None, report_date=None):
         """Создание нового отчета"""
@@ -28,28 +64,107 @@ class ReportService:
                 report_date=report_date or datetime.now()
             )
             session.add(report)
-            session.commit()
+            RollupService.apply_values(session, [(RollupService.get_report_bucket(report), metric_value)])
+            ReportService.delete_stored_summaries(session)
+            commit_session(session)
+            run_after_commit(session, ReportService.invalidate_weekly_summaries)
             logger.info(f"Создан новый отчет: ID={report.id}")
-            return report
+            return ReportDTO.from_model(report)
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при создании отчета: {e}")
+            rollback_session(session)
             return None
         finally:
-            session.close()
+            close_session(session)
+
+    @staticmethod
+    def validate_report(report):
+        """Проверка и приведение полей отчета перед записью.
+
+        Возвращает новый словарь; при недопустимых данных - ValueError
+        с текстом для пользователя.
+        """
+        description = report.get('description')
+        if not isinstance(description, str) or not description.strip():
+            raise ValueError("Описание обязательно")
+
+        metric_name = report.get('metric_name')
+        if metric_name is not None and not isinstance(metric_name, str):
+            raise ValueError("Название показателя должно быть строкой")
+        metric_name = (metric_name or '').strip() or None
+        if metric_name and len(metric_name) > 100:
+            raise ValueError("Название показателя длиннее 100 символов")
+
+        metric_value = report.get('metric_value')
+        if isinstance(metric_value, str):
+            metric_value = metric_value.strip().replace(',', '.') or None
+        if metric_value is not None:
+            if isinstance(metric_value, bool):
+                raise ValueError("Значение показателя должно быть числом")
+            try:
+                metric_value = float(metric_value)
+            except (TypeError, ValueError):
+                raise ValueError("Значение показателя должно быть числом")
+            if not math.isfinite(metric_value):
+                raise ValueError("Значение показателя должно быть числом")
+
+        return dict(report, description=description, metric_name=metric_name, metric_value=metric_value)
+
+    @staticmethod
+    def create_reports_bulk(reports):
+        """Создание пачки отчетов одним запросом и одной транзакцией.
+
+        reports - список словарей с полями отчета. Возвращает число
+        созданных отчетов или None при ошибке.
+        """
+        if not reports:
+            return 0
+
+        now = datetime.now()
+        rows = [
+            {
+                'user_id': report.get('user_id'),
+                'team_id': report.get('team_id'),
+                'description': report['description'],
+                'metric_value': report.get('metric_value'),
+                'metric_name': report.get('metric_name'),
+                'report_date': report.get('report_date') or now
+            }
+            for report in reports
+        ]
+
+        session = get_session()
+        try:
+            session.execute(insert(Report), rows)
+            RollupService.apply_values(session, [
+                (RollupService.get_bucket(row['team_id'], row['user_id'], row['metric_name'],
+                                          row['metric_value'], row['report_date']), row['metric_value'])
+                for row in rows
+            ])
+            ReportService.delete_stored_summaries(session)
+            commit_session(session)
+            run_after_commit(session, ReportService.invalidate_weekly_summaries)
+            logger.info(f"Создано отчетов пачкой: {len(rows)}")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Ошибка при пакетном создании отчетов: {e}")
+            rollback_session(session)
+            return None
+        finally:
+            close_session(session)
 
     @staticmethod
     def get_report_by_id(report_id):
         """Получение отчета по ID"""
         session = get_session()
         try:
-            report = session.query(Report).filter(Report.id == report_id).first()
-            return report
+            report = ReportService._query_reports(session).filter(Report.id == report_id).first()
+            return ReportDTO.from_model(report)
         except Exception as e:
             logger.error(f"Ошибка при получении отчета: {e}")
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def update_report(report_id, **kwargs):
@@ -61,21 +176,27 @@ class ReportService:
                 logger.warning(f"Отчет с ID {report_id} не найден")
                 return None
 
+            old_bucket = RollupService.get_report_bucket(report)
+
             # Обновление полей
             for key, value in kwargs.items():
                 if hasattr(report, key):
                     setattr(report, key, value)
             
-            report.updated_at = datetime.now()
-            session.commit()
+            # updated_at хранится в UTC, как и значения по умолчанию в модели
+            report.updated_at = datetime.utcnow()
+            RollupService.refresh_buckets(session, [old_bucket, RollupService.get_report_bucket(report)])
+            ReportService.delete_stored_summaries(session)
+            commit_session(session)
+            run_after_commit(session, ReportService.invalidate_weekly_summaries)
             logger.info(f"Данные отчета ID={report.id} обновлены")
-            return report
+            return ReportDTO.from_model(report)
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при обновлении отчета: {e}")
+            rollback_session(session)
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def delete_report(report_id):
@@ -87,23 +208,27 @@ class ReportService:
                 logger.warning(f"Отчет с ID {report_id} не найден")
                 return False
 
+            bucket = RollupService.get_report_bucket(report)
             session.delete(report)
-            session.commit()
+            RollupService.refresh_buckets(session, [bucket])
+            ReportService.delete_stored_summaries(session)
+            commit_session(session)
+            run_after_commit(session, ReportService.invalidate_weekly_summaries)
             logger.info(f"Отчет ID={report_id} удален")
             return True
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при удалении отчета: {e}")
+            rollback_session(session)
             return False
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def get_user_reports(user_id, start_date=None, end_date=None):
         """Получение отчетов пользователя за период"""
         session = get_session()
         try:
-            query = session.query(Report).filter(Report.user_id == user_id)
+            query = ReportService._query_reports(session).filter(Report.user_id == user_id)
             
             if start_date:
                 query = query.filter(Report.report_date >= start_date)
@@ -112,19 +237,78 @@ class ReportService:
                 query = query.filter(Report.report_date <= end_date)
             
             reports = query.order_by(Report.report_date.desc()).all()
-            return reports
+            return [ReportDTO.from_model(report) for report in reports]
         except Exception as e:
             logger.error(f"Ошибка при получении отчетов пользователя: {e}")
             return []
         finally:
-            session.close()
+            close_session(session)
+
+    @staticmethod
+    def encode_cursor(report):
+        """Курсор страницы по (COALESCE(report_date, created_at), id) последнего отчета"""
+        # То же значение, что REPORT_SORT_DATE в запросе страницы
+        report_date = report.report_date or report.created_at or datetime.min
+        return f"{report_date.isoformat()}|{report.id}"
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Разбор курсора страницы, ValueError при неверном формате"""
+        report_date, report_id = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(report_date), int(report_id)
+
+    @staticmethod
+    def get_user_reports_page(user_id, cursor=None, limit=REPORTS_PAGE_SIZE):
+        """Получение страницы отчетов пользователя, начиная после курсора"""
+        limit = max(1, min(int(limit), MAX_REPORTS_PAGE_SIZE))
+        session = get_session()
+        try:
+            query = ReportService._query_reports(session).filter(Report.user_id == user_id)
+
+            # Поиск по индексу (user_id, COALESCE(report_date, created_at)) вместо OFFSET:
+            # строки без report_date сортируются по дате создания и не выпадают со страниц
+            if cursor:
+                cursor_date, cursor_id = ReportService.decode_cursor(cursor)
+                query = query.filter(or_(
+                    REPORT_SORT_DATE < cursor_date,
+                    and_(REPORT_SORT_DATE == cursor_date, Report.id < cursor_id)
+                ))
+
+            # Лишняя строка показывает, есть ли следующая страница
+            reports = query.order_by(
+                REPORT_SORT_DATE.desc(),
+                Report.id.desc()
+            ).limit(limit + 1).all()
+
+            next_cursor = None
+            if len(reports) > limit:
+                reports = reports[:limit]
+                next_cursor = ReportService.encode_cursor(reports[-1])
+
+            return [ReportDTO.from_model(report) for report in reports], next_cursor
+        except Exception as e:
+            logger.error(f"Ошибка при получении страницы отчетов пользователя: {e}")
+            return [], None
+        finally:
+            close_session(session)
+
+    @staticmethod
+    def report_to_dict(report):
+        """Представление отчета для JSON API"""
+        return {
+            'id': report.id,
+            'description': report.description,
+            'metric_name': report.metric_name,
+            'metric_value': report.metric_value,
+            'report_date': report.report_date.isoformat() if report.report_date else None
+        }
 
     @staticmethod
     def get_team_reports(team_id, start_date=None, end_date=None):
         """Получение отчетов команды за период"""
         session = get_session()
         try:
-            query = session.query(Report).filter(Report.team_id == team_id)
+            query = ReportService._query_reports(session).filter(Report.team_id == team_id)
             
             if start_date:
                 query = query.filter(Report.report_date >= start_date)
@@ -133,22 +317,75 @@ class ReportService:
                 query = query.filter(Report.report_date <= end_date)
             
             reports = query.order_by(Report.report_date.desc()).all()
-            return reports
+            return [ReportDTO.from_model(report) for report in reports]
         except Exception as e:
             logger.error(f"Ошибка при получении отчетов команды: {e}")
             return []
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
-    def get_weekly_reports(team_id=None):
-        """Получение отчетов за последнюю неделю"""
+    def iter_export_rows(team_id=None, user_id=None, start_date=None, end_date=None, all_teams=False,
+                         batch_size=EXPORT_BATCH_SIZE):
+        """Потоковое чтение отчетов для экспорта пачками, без загрузки всей выборки в память.
+
+        Выгрузка без команды и пользователя возможна только с явным
+        all_teams=True; иначе ValueError сразу при вызове, до начала потока.
+        """
+        if team_id is None and user_id is None and not all_teams:
+            raise ValueError("Не указаны команда или пользователь для экспорта")
+        return ReportService._iter_export_rows(team_id, user_id, start_date, end_date, batch_size)
+
+    @staticmethod
+    def _iter_export_rows(team_id, user_id, start_date, end_date, batch_size):
+        session = get_session()
+        try:
+            query = select(
+                Report.id,
+                Report.report_date,
+                Team.name.label('team_name'),
+                User.name.label('user_name'),
+                Report.description,
+                Report.metric_name,
+                Report.metric_value
+            ).outerjoin(Team, Team.id == Report.team_id).outerjoin(User, User.id == Report.user_id)
+
+            if team_id is not None:
+                query = query.where(Report.team_id == team_id)
+
+            if user_id is not None:
+                query = query.where(Report.user_id == user_id)
+
+            if start_date:
+                query = query.where(Report.report_date >= start_date)
+
+            if end_date:
+                query = query.where(Report.report_date <= end_date)
+
+            # yield_per включает серверный курсор там, где он поддерживается
+            result = session.execute(
+                query.order_by(Report.report_date, Report.id).execution_options(yield_per=batch_size)
+            )
+            for partition in result.partitions():
+                yield from partition
+        finally:
+            close_session(session)
+
+    @staticmethod
+    def _get_week_bounds():
+        """Границы периода за последнюю неделю"""
         end_date = datetime.now()
         start_date = end_date - timedelta(days=7)
+        return start_date, end_date
+
+    @staticmethod
+    def get_weekly_reports(team_id=None):
+        """Получение отчетов за последнюю неделю"""
+        start_date, end_date = ReportService._get_week_bounds()
         
         session = get_session()
         try:
-            query = session.query(Report).filter(
+            query = ReportService._query_reports(session).filter(
                 Report.report_date >= start_date,
                 Report.report_date <= end_date
             )
@@ -157,55 +394,204 @@ class ReportService:
                 query = query.filter(Report.team_id == team_id)
             
             reports = query.order_by(Report.report_date.desc()).all()
-            return reports
+            return [ReportDTO.from_model(report) for report in reports]
         except Exception as e:
             logger.error(f"Ошибка при получении еженедельных отчетов: {e}")
             return []
         finally:
-            session.close()
+            close_session(session)
+
+    @staticmethod
+    def get_weekly_summary_data(team_id=None):
+        """Сбор данных сводки за неделю одним запросом с названиями команд"""
+        start_date, end_date = ReportService._get_week_bounds()
+
+        session = get_session()
+        try:
+            query = session.query(
+                Report.team_id,
+                Team.name.label('team_name'),
+                Report.description,
+                Report.metric_name,
+                Report.metric_value,
+                Report.report_date
+            ).join(Team, Team.id == Report.team_id).filter(
+                Report.report_date >= start_date,
+                Report.report_date <= end_date
+            )
+
+            if team_id:
+                query = query.filter(Report.team_id == team_id)
+
+            query = query.order_by(Report.report_date.desc()).yield_per(SUMMARY_BATCH_SIZE)
+
+            # Группировка отчетов по командам в порядке их появления
+            teams_data = {}
+            total_reports = 0
+            for row in query:
+                team = teams_data.get(row.team_id)
+                if team is None:
+                    team = teams_data[row.team_id] = {
+                        'team_id': row.team_id,
+                        'team_name': row.team_name,
+                        'reports_count': 0,
+                        'metrics': {},
+                        'reports': []
+                    }
+
+                team['reports_count'] += 1
+                total_reports += 1
+                team['reports'].append({
+                    'description': row.description,
+                    'metric_name': row.metric_name,
+                    'metric_value': row.metric_value,
+                    'report_date': row.report_date.isoformat() if row.report_date else None
+                })
+
+                # Суммирование показателей по названию метрики
+                if row.metric_name and row.metric_value is not None:
+                    metrics = team['metrics']
+                    metrics[row.metric_name] = metrics.get(row.metric_name, 0) + row.metric_value
+
+            return {
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'total_reports': total_reports,
+                'teams': list(teams_data.values())
+            }
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных сводки: {e}")
+            return None
+        finally:
+            close_session(session)
+
+    @staticmethod
+    def format_weekly_summary(summary_data):
+        """Формирование текста сводки за неделю"""
+        if summary_data is None:
+            return "Произошла ошибка при генерации сводки."
+
+        if not summary_data['teams']:
+            return "Нет отчетов за последнюю неделю."
+
+        lines = ["Еженедельный отчет:", ""]
+
+        for team in summary_data['teams']:
+            lines.append(f"Команда: {team['team_name']}")
+            lines.append(f"Количество отчетов: {team['reports_count']}")
+            lines.append("Описание выполненных задач:")
+
+            for report in team['reports']:
+                lines.append(f"- {report['description']}")
+                if report['metric_value'] and report['metric_name']:
+                    lines.append(f"  {report['metric_name']}: {report['metric_value']}")
+
+            lines.append("")
+
+        return "\n".join(lines) + "\n"
 
     @staticmethod
     def generate_weekly_summary(team_id=None):
         """Генерация сводки за неделю"""
-        reports = ReportService.get_weekly_reports(team_id)
-        
-        if not reports:
-            return "Нет отчетов за последнюю неделю."
-        
-        # Группировка отчетов по командам
-        teams_data = {}
+        summary_data = ReportService.get_weekly_summary_data(team_id)
+        return ReportService.format_weekly_summary(summary_data)
+
+    @staticmethod
+    def invalidate_weekly_summaries():
+        """Сброс кэша сводок после изменения отчетов"""
+        ReportService._summary_cache.clear()
+
+    @staticmethod
+    def delete_stored_summaries(session):
+        """Удаление сохраненных сводок в транзакции, изменяющей отчеты"""
+        session.query(WeeklySummary).delete(synchronize_session=False)
+
+    @staticmethod
+    def get_stored_summary(team_id=None):
+        """Сводка из таблицы weekly_summaries, если она моложе SUMMARY_CACHE_TTL"""
         session = get_session()
-        
         try:
-            for report in reports:
-                team = session.query(Team).filter(Team.id == report.team_id).first()
-                if not team:
-                    continue
-                
-                team_name = team.name
-                if team_name not in teams_data:
-                    teams_data[team_name] = []
-                
-                teams_data[team_name].append(report)
-            
-            # Формирование текстового отчета
-            summary = "Еженедельный отчет:\n\n"
-            
-            for team_name, team_reports in teams_data.items():
-                summary += f"Команда: {team_name}\n"
-                summary += f"Количество отчетов: {len(team_reports)}\n"
-                summary += "Описание выполненных задач:\n"
-                
-                for report in team_reports:
-                    summary += f"- {report.description}\n"
-                    if report.metric_value and report.metric_name:
-                        summary += f"  {report.metric_name}: {report.metric_value}\n"
-                
-                summary += "\n"
-            
-            return summary
+            stored = session.query(WeeklySummary).filter(
+                WeeklySummary.team_id == (team_id or 0),
+                WeeklySummary.created_at >= datetime.utcnow() - timedelta(seconds=SUMMARY_CACHE_TTL)
+            ).first()
+            if stored is None:
+                return None
+            return json.loads(stored.data), stored.text
         except Exception as e:
-            logger.error(f"Ошибка при генерации сводки: {e}")
-            return "Произошла ошибка при генерации сводки."
+            logger.error(f"Ошибка при чтении сохраненной сводки: {e}")
+            return None
+        finally:
+            close_session(session)
+
+    @staticmethod
+    def store_summaries(summaries):
+        """Сохранение рассчитанных сводок {team_id: (summary_data, text)} в таблицу"""
+        session = get_session()
+        try:
+            created_at = datetime.utcnow()
+            for team_id, (summary_data, text) in summaries.items():
+                session.merge(WeeklySummary(
+                    team_id=team_id or 0,
+                    data=json.dumps(summary_data, ensure_ascii=False),
+                    text=text,
+                    created_at=created_at
+                ))
+            commit_session(session)
+            return True
+        except Exception as e:
+            rollback_session(session)
+            logger.error(f"Ошибка при сохранении сводок: {e}")
+            return False
         finally:
-            session.close() 
\ No newline at end of file
+            close_session(session)
+
+    @staticmethod
+    def get_cached_weekly_summary(team_id=None):
+        """Данные и текст сводки за неделю из кэша или таблицы сводок, при отсутствии - с расчетом.
+
+        Возвращает пару (summary_data, text); summary_data равно None при ошибке.
+        """
+        cached = ReportService._summary_cache.get(team_id)
+        if cached is not None:
+            return cached
+
+        stored = ReportService.get_stored_summary(team_id)
+        if stored is not None:
+            ReportService._summary_cache.set(team_id, stored)
+            return stored
+
+        summary_data = ReportService.get_weekly_summary_data(team_id)
+        result = (summary_data, ReportService.format_weekly_summary(summary_data))
+        if summary_data is not None:
+            ReportService._summary_cache.set(team_id, result)
+        return result
+
+    @staticmethod
+    def precompute_weekly_summaries():
+        """Расчет сводок всех команд одним запросом с сохранением в кэш и таблицу сводок.
+
+        Возвращает словарь {team_id: (summary_data, text)} по командам с отчетами.
+        """
+        summary_data = ReportService.get_weekly_summary_data()
+        if summary_data is None:
+            return {}
+
+        overall = (summary_data, ReportService.format_weekly_summary(summary_data))
+        ReportService._summary_cache.set(None, overall)
+
+        summaries = {}
+        for team in summary_data['teams']:
+            team_data = {
+                'start_date': summary_data['start_date'],
+                'end_date': summary_data['end_date'],
+                'total_reports': team['reports_count'],
+                'teams': [team]
+            }
+            summaries[team['team_id']] = (team_data, ReportService.format_weekly_summary(team_data))
+            ReportService._summary_cache.set(team['team_id'], summaries[team['team_id']])
+
+        ReportService.store_summaries({None: overall, **summaries})
+        return summaries
+
+metrics.register_stats('cache', ReportService._summary_cache.stats, cache='weekly_summary')
@@ -0,0 +1,201 @@
+import sys
+import os
+import logging
+from datetime import datetime, time, timedelta
+from sqlalchemy import func, select, insert
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.models import Report, MetricDailyRollup
+from db.database import get_session, commit_session, rollback_session, close_session
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class RollupService:
+    """Сервис дневных агрегатов показателей (таблица metric_daily_rollup).
+
+    Методы apply_values и refresh_buckets принимают сессию вызывающего
+    сервиса, чтобы агрегаты менялись в той же транзакции, что и отчеты.
+    """
+
+    @staticmethod
+    def get_bucket(team_id, user_id, metric_name, metric_value, report_date):
+        """Ключ дневного агрегата для отчета или None, если показателя нет"""
+        if not metric_name or metric_value is None or report_date is None:
+            return None
+        return (team_id or 0, user_id or 0, metric_name, report_date.date())
+
+    @staticmethod
+    def get_report_bucket(report):
+        """Ключ дневного агрегата для объекта отчета"""
+        return RollupService.get_bucket(
+            report.team_id, report.user_id, report.metric_name,
+            report.metric_value, report.report_date
+        )
+
+    @staticmethod
+    def apply_values(session, values):
+        """Инкрементальное добавление показателей новых отчетов.
+
+        values - список пар (ключ агрегата, значение показателя).
+        """
+        # Сначала сворачиваем пачку по ключам, затем обновляем каждый агрегат один раз
+        batch = {}
+        for bucket, value in values:
+            if bucket is None:
+                continue
+            value = float(value)
+            aggregate = batch.get(bucket)
+            if aggregate is None:
+                batch[bucket] = [1, value, value, value]
+            else:
+                aggregate[0] += 1
+                aggregate[1] += value
+                aggregate[2] = min(aggregate[2], value)
+                aggregate[3] = max(aggregate[3], value)
+
+        if not batch:
+            return
+
+        rows = [
+            {
+                'team_id': team_id,
+                'user_id': user_id,
+                'metric_name': metric_name,
+                'day': day,
+                'value_count': count,
+                'value_sum': total,
+                'value_min': minimum,
+                'value_max': maximum
+            }
+            for (team_id, user_id, metric_name, day), (count, total, minimum, maximum) in batch.items()
+        ]
+
+        upsert = RollupService._get_upsert(session)
+        if upsert is not None:
+            session.execute(upsert, rows)
+            return
+
+        # Для прочих СУБД обновляем агрегаты через ORM
+        for row in rows:
+            key = (row['team_id'], row['user_id'], row['metric_name'], row['day'])
+            rollup = session.get(MetricDailyRollup, key)
+            if rollup is None:
+                session.add(MetricDailyRollup(**row))
+                continue
+            rollup.value_count += row['value_count']
+            rollup.value_sum += row['value_sum']
+            rollup.value_min = min(rollup.value_min, row['value_min'])
+            rollup.value_max = max(rollup.value_max, row['value_max'])
+
+    @staticmethod
+    def _get_upsert(session):
+        """Атомарная вставка с накоплением агрегата для SQLite и PostgreSQL"""
+        dialect = session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            least, greatest = func.min, func.max
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            least, greatest = func.least, func.greatest
+        else:
+            return None
+
+        statement = dialect_insert(MetricDailyRollup)
+        excluded = statement.excluded
+        return statement.on_conflict_do_update(
+            index_elements=['team_id', 'user_id', 'metric_name', 'day'],
+            set_={
+                'value_count': MetricDailyRollup.value_count + excluded.value_count,
+                'value_sum': MetricDailyRollup.value_sum + excluded.value_sum,
+                'value_min': least(MetricDailyRollup.value_min, excluded.value_min),
+                'value_max': greatest(MetricDailyRollup.value_max, excluded.value_max)
+            }
+        )
+
+    @staticmethod
+    def refresh_buckets(session, buckets):
+        """Пересчет агрегатов по исходным отчетам (после изменения или удаления отчета)"""
+        session.flush()
+        for bucket in set(buckets):
+            if bucket is None:
+                continue
+
+            team_id, user_id, metric_name, day = bucket
+            day_start = datetime.combine(day, time.min)
+            count, total, minimum, maximum = session.query(
+                func.count(Report.metric_value),
+                func.sum(Report.metric_value),
+                func.min(Report.metric_value),
+                func.max(Report.metric_value)
+            ).filter(
+                RollupService._id_filter(Report.user_id, user_id),
+                RollupService._id_filter(Report.team_id, team_id),
+                Report.metric_name == metric_name,
+                Report.report_date >= day_start,
+                Report.report_date < day_start + timedelta(days=1)
+            ).one()
+
+            rollup = session.get(MetricDailyRollup, bucket)
+            if not count:
+                if rollup is not None:
+                    session.delete(rollup)
+                continue
+
+            if rollup is None:
+                rollup = MetricDailyRollup(team_id=team_id, user_id=user_id, metric_name=metric_name, day=day)
+                session.add(rollup)
+            rollup.value_count = count
+            rollup.value_sum = total
+            rollup.value_min = minimum
+            rollup.value_max = maximum
+
+    @staticmethod
+    def _id_filter(column, value):
+        # 0 в ключе агрегата соответствует отсутствующей ссылке
+        return column.is_(None) if value == 0 else column == value
+
+    @staticmethod
+    def backfill():
+        """Полное перестроение агрегатов по таблице отчетов"""
+        session = get_session()
+        try:
+            session.query(MetricDailyRollup).delete()
+
+            day = func.date(Report.report_date)
+            source = select(
+                func.coalesce(Report.team_id, 0),
+                func.coalesce(Report.user_id, 0),
+                Report.metric_name,
+                day,
+                func.count(Report.metric_value),
+                func.sum(Report.metric_value),
+                func.min(Report.metric_value),
+                func.max(Report.metric_value)
+            ).where(
+                Report.metric_name.isnot(None),
+                Report.metric_value.isnot(None),
+                Report.report_date.isnot(None)
+            ).group_by(
+                func.coalesce(Report.team_id, 0),
+                func.coalesce(Report.user_id, 0),
+                Report.metric_name,
+                day
+            )
+
+            session.execute(insert(MetricDailyRollup).from_select(
+                ['team_id', 'user_id', 'metric_name', 'day',
+                 'value_count', 'value_sum', 'value_min', 'value_max'],
+                source
+            ))
+            commit_session(session)
+
+            count = session.query(func.count()).select_from(MetricDailyRollup).scalar()
+            logger.info(f"Агрегаты показателей перестроены: {count} строк")
+            return count
+        except Exception as e:
+            logger.error(f"Ошибка при перестроении агрегатов показателей: {e}")
+            rollback_session(session)
+            return None
+        finally:
+            close_session(session)
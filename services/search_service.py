@@ -0,0 +1,166 @@
+import sys
+import os
+import re
+import logging
+from sqlalchemy import select, text, func, and_
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.models import Report, User, Team, UserRole, REPORT_SEARCH_TABLE
+from db.database import get_session, close_session
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Размер страницы результатов поиска и его верхняя граница
+SEARCH_PAGE_SIZE = 10
+MAX_SEARCH_PAGE_SIZE = 50
+
+# Слова запроса: буквы, цифры и подчеркивание в любом алфавите
+SEARCH_TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+class SearchService:
+    """Полнотекстовый поиск по описаниям отчетов"""
+
+    @staticmethod
+    def get_terms(query):
+        """Слова поискового запроса в нижнем регистре"""
+        return [term.lower() for term in SEARCH_TERM_PATTERN.findall(query or '')]
+
+    @staticmethod
+    def get_scope(user, team_id=None, user_id=None):
+        """Фильтры поиска по роли пользователя.
+
+        Администратор ищет везде и может сузить поиск командой и автором
+        (team_id, user_id из запроса); руководитель - в своей команде,
+        руководитель без команды и сотрудник - только в своих отчетах.
+        Фильтры из запроса для них не учитываются.
+        """
+        if user.role == UserRole.ADMIN:
+            return {'team_id': team_id, 'user_id': user_id}
+        if user.role == UserRole.MANAGER and user.team_id is not None:
+            return {'team_id': user.team_id, 'user_id': None}
+        return {'team_id': None, 'user_id': user.id}
+
+    @staticmethod
+    def build_match_query(terms):
+        """Запрос FTS5: все слова обязательны, последнее ищется как префикс"""
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    @staticmethod
+    def search_reports(query, team_id=None, user_id=None, start_date=None, end_date=None,
+                       page=1, limit=SEARCH_PAGE_SIZE):
+        """Поиск отчетов по словам из описания с сортировкой по релевантности.
+
+        Возвращает (results, has_more); results - список словарей с полями
+        отчета и фрагментом описания snippet, где найденные слова выделены
+        символами [ и ].
+        """
+        terms = SearchService.get_terms(query)
+        if not terms:
+            return [], False
+
+        limit = max(1, min(limit, MAX_SEARCH_PAGE_SIZE))
+        page = max(1, page)
+
+        session = get_session()
+        try:
+            is_sqlite = session.get_bind().dialect.name == 'sqlite'
+            if is_sqlite:
+                statement = SearchService._fts_query(terms)
+            else:
+                statement = SearchService._like_query(terms)
+
+            if team_id is not None:
+                statement = statement.where(Report.team_id == team_id)
+
+            if user_id is not None:
+                statement = statement.where(Report.user_id == user_id)
+
+            if start_date:
+                statement = statement.where(Report.report_date >= start_date)
+
+            if end_date:
+                statement = statement.where(Report.report_date <= end_date)
+
+            # Одна лишняя строка показывает, есть ли следующая страница
+            rows = session.execute(
+                statement.limit(limit + 1).offset((page - 1) * limit),
+                {'match': SearchService.build_match_query(terms)} if is_sqlite else {}
+            ).all()
+
+            results = [
+                {
+                    'id': row.id,
+                    'user_id': row.user_id,
+                    'team_id': row.team_id,
+                    'user_name': row.user_name,
+                    'team_name': row.team_name,
+                    'report_date': row.report_date.isoformat() if row.report_date else None,
+                    'metric_name': row.metric_name,
+                    'metric_value': row.metric_value,
+                    'snippet': row.snippet
+                }
+                for row in rows[:limit]
+            ]
+            return results, len(rows) > limit
+        except Exception as e:
+            logger.error(f"Ошибка при поиске отчетов: {e}")
+            return [], False
+        finally:
+            close_session(session)
+
+    @staticmethod
+    def _columns():
+        return (
+            Report.id,
+            Report.user_id,
+            Report.team_id,
+            User.name.label('user_name'),
+            Team.name.label('team_name'),
+            Report.report_date,
+            Report.metric_name,
+            Report.metric_value
+        )
+
+    @staticmethod
+    def _fts_query(terms):
+        """Поиск по индексу FTS5 с ранжированием bm25"""
+        search = text(
+            f"SELECT rowid, bm25({REPORT_SEARCH_TABLE}) AS rank, "
+            f"snippet({REPORT_SEARCH_TABLE}, 0, '[', ']', '…', 16) AS snippet "
+            f"FROM {REPORT_SEARCH_TABLE} WHERE {REPORT_SEARCH_TABLE} MATCH :match"
+        ).columns(rowid=Report.id.type, rank=Report.metric_value.type, snippet=Report.description.type)
+        matches = search.subquery('matches')
+
+        return select(*SearchService._columns(), matches.c.snippet).join(
+            matches, matches.c.rowid == Report.id
+        ).outerjoin(User, User.id == Report.user_id).outerjoin(
+            Team, Team.id == Report.team_id
+        ).order_by(matches.c.rank, Report.report_date.desc())
+
+    @staticmethod
+    def _like_query(terms):
+        """Поиск подстрок для СУБД без FTS5 (без ранжирования)"""
+        return select(*SearchService._columns(), func.substr(Report.description, 1, 200).label('snippet')).where(
+            and_(*[Report.description.ilike(f"%{term}%") for term in terms])
+        ).outerjoin(User, User.id == Report.user_id).outerjoin(
+            Team, Team.id == Report.team_id
+        ).order_by(Report.report_date.desc())
+
+    @staticmethod
+    def format_results(query, results, page=1):
+        """Текст результатов поиска для сообщения бота"""
+        if not results:
+            return f"По запросу «{query}» ничего не найдено." if page == 1 else "Больше результатов нет."
+
+        lines = [f"Результаты поиска «{query}», страница {page}:", ""]
+        for result in results:
+            report_date = result['report_date'][:10] if result['report_date'] else ''
+            author = result['user_name'] or 'Без автора'
+            if result['team_name']:
+                author += f" ({result['team_name']})"
+            lines.append(f"{report_date} — {author}")
+            lines.append(f"  {result['snippet']}")
+        return "\n".join(lines)
@@ -0,0 +1,365 @@
+import sys
+import os
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.models import MetricDailyRollup, Report, User, Team
+from db.database import get_session, close_session
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Перцентили показателей и окно скользящего среднего дневных сумм в днях
+STATS_PERCENTILES = (50, 90, 95)
+MOVING_AVERAGE_WINDOW = 7
+
+class MetricArrays:
+    """Дневные агрегаты показателей в виде столбцов NumPy"""
+    __slots__ = ('user_id', 'team_id', 'metric_code', 'metric_names', 'day', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, user_id, team_id, metric_code, metric_names, day, count, sum, min, max):
+        self.user_id = user_id
+        self.team_id = team_id
+        self.metric_code = metric_code  # индекс названия метрики в metric_names
+        self.metric_names = metric_names
+        self.day = day  # datetime64[D]
+        self.count = count
+        self.sum = sum
+        self.min = min
+        self.max = max
+
+    def __len__(self):
+        return len(self.day)
+
+    def select(self, mask):
+        """Строки, отобранные маской, с тем же словарем названий метрик"""
+        return MetricArrays(
+            self.user_id[mask], self.team_id[mask], self.metric_code[mask], self.metric_names,
+            self.day[mask], self.count[mask], self.sum[mask], self.min[mask], self.max[mask]
+        )
+
+class StatsService:
+    """Сервис статистики по показателям отчетов.
+
+    Данные берутся из дневных агрегатов metric_daily_rollup (несколько
+    сотен строк вместо всех отчетов за период) и считаются векторно в NumPy.
+    Перцентили по дневным агрегатам точно не восстановить, поэтому для них
+    читается один столбец metric_value отчетов за период.
+    """
+
+    @staticmethod
+    def load_metrics(team_id=None, user_id=None, start_day=None, end_day=None):
+        """Загрузка дневных агрегатов одним запросом в столбцы NumPy"""
+        session = get_session()
+        try:
+            query = select(
+                MetricDailyRollup.user_id,
+                MetricDailyRollup.team_id,
+                MetricDailyRollup.metric_name,
+                MetricDailyRollup.day,
+                MetricDailyRollup.value_count,
+                MetricDailyRollup.value_sum,
+                MetricDailyRollup.value_min,
+                MetricDailyRollup.value_max
+            )
+
+            if team_id is not None:
+                query = query.where(MetricDailyRollup.team_id == team_id)
+
+            if user_id is not None:
+                query = query.where(MetricDailyRollup.user_id == user_id)
+
+            if start_day:
+                query = query.where(MetricDailyRollup.day >= start_day)
+
+            if end_day:
+                query = query.where(MetricDailyRollup.day <= end_day)
+
+            rows = session.connection().execute(query).fetchall()
+        finally:
+            close_session(session)
+
+        if not rows:
+            empty = np.array([], dtype=np.int64)
+            empty_values = np.array([], dtype=np.float64)
+            return MetricArrays(empty, empty, empty, np.array([], dtype=str), np.array([], dtype='datetime64[D]'),
+                                empty, empty_values, empty_values, empty_values)
+
+        user_ids, team_ids, names, days, counts, sums, minimums, maximums = zip(*rows)
+        metric_names, metric_code = np.unique(np.array(names, dtype=str), return_inverse=True)
+        return MetricArrays(
+            user_id=np.array(user_ids, dtype=np.int64),
+            team_id=np.array(team_ids, dtype=np.int64),
+            metric_code=metric_code.reshape(-1).astype(np.int64),
+            metric_names=metric_names,
+            day=np.array(days, dtype='datetime64[D]'),
+            count=np.array(counts, dtype=np.int64),
+            sum=np.array(sums, dtype=np.float64),
+            min=np.array(minimums, dtype=np.float64),
+            max=np.array(maximums, dtype=np.float64)
+        )
+
+    @staticmethod
+    def load_values(metric_names, team_id=None, user_id=None, start_day=None):
+        """Значения показателей отчетов за период: (коды метрик из metric_names, значения)"""
+        session = get_session()
+        try:
+            query = select(Report.metric_name, Report.metric_value).where(
+                Report.metric_name.isnot(None),
+                Report.metric_value.isnot(None)
+            )
+
+            if team_id is not None:
+                query = query.where(Report.team_id == team_id)
+
+            if user_id is not None:
+                query = query.where(Report.user_id == user_id)
+
+            if start_day:
+                query = query.where(Report.report_date >= datetime.combine(start_day, datetime.min.time()))
+
+            rows = session.connection().execute(query).fetchall()
+        finally:
+            close_session(session)
+
+        if not rows:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        names, values = zip(*rows)
+        names = np.array(names, dtype=str)
+        # Коды в словаре дневных агрегатов; метрики, которых там нет, отбрасываются
+        codes = np.searchsorted(metric_names, names)
+        known = (codes < len(metric_names))
+        known[known] = metric_names[codes[known]] == names[known]
+        return codes[known].astype(np.int64), np.array(values, dtype=np.float64)[known]
+
+    @staticmethod
+    def load_names(model, ids):
+        """Названия команд или имена пользователей по ID одним запросом"""
+        ids = [int(item) for item in ids if item]
+        if not ids:
+            return {}
+        session = get_session()
+        try:
+            return dict(session.execute(select(model.id, model.name).where(model.id.in_(ids))).all())
+        finally:
+            close_session(session)
+
+    @staticmethod
+    def percentiles(codes, values, group_count, percentiles=STATS_PERCENTILES):
+        """Перцентили значений по группам codes: массив group_count x len(percentiles), NaN для пустых групп"""
+        result = np.full((group_count, len(percentiles)), np.nan)
+        # Значения сортируются внутри групп, группы режутся по границам
+        order = np.lexsort((values, codes))
+        sorted_values = values[order]
+        counts = np.bincount(codes, minlength=group_count)
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        for code in np.flatnonzero(counts):
+            result[code] = np.percentile(sorted_values[bounds[code]:bounds[code + 1]], percentiles)
+        return result
+
+    @staticmethod
+    def aggregate(metrics, by=('metric_code',)):
+        """Агрегаты (count, sum, mean, min, max) по группам столбцов by"""
+        if not len(metrics):
+            return []
+
+        # Составной ключ группы кодируется одним целым числом
+        uniques = []
+        keys = np.zeros(len(metrics), dtype=np.int64)
+        for name in by:
+            column_values, codes = np.unique(getattr(metrics, name), return_inverse=True)
+            keys = keys * len(column_values) + codes.reshape(-1)
+            uniques.append(column_values)
+
+        group_keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        group_count = len(group_keys)
+
+        # Обратное разложение ключа на значения столбцов
+        groups = []
+        remainder = group_keys
+        for column_values in reversed(uniques):
+            groups.append(column_values[remainder % len(column_values)])
+            remainder = remainder // len(column_values)
+        groups = list(zip(*reversed(groups)))
+
+        counts = np.bincount(inverse, weights=metrics.count, minlength=group_count)
+        sums = np.bincount(inverse, weights=metrics.sum, minlength=group_count)
+        minimums = np.full(group_count, np.inf)
+        maximums = np.full(group_count, -np.inf)
+        np.minimum.at(minimums, inverse, metrics.min)
+        np.maximum.at(maximums, inverse, metrics.max)
+
+        result = []
+        for index, group in enumerate(groups):
+            item = {}
+            for name, key in zip(by, group):
+                if name == 'metric_code':
+                    item['metric_name'] = str(metrics.metric_names[key])
+                else:
+                    item[name] = int(key)
+            item.update({
+                'count': int(counts[index]),
+                'sum': float(sums[index]),
+                'mean': float(sums[index] / counts[index]) if counts[index] else 0.0,
+                'min': float(minimums[index]),
+                'max': float(maximums[index])
+            })
+            result.append(item)
+        return result
+
+    @staticmethod
+    def week_over_week(metrics, today=None):
+        """Суммы показателей за текущую и прошлую неделю и их изменение"""
+        today = np.datetime64(today or datetime.now().date(), 'D')
+        # 0 - последние 7 дней включая сегодня, 1 - предыдущие 7 дней
+        week = (today - metrics.day).astype(np.int64) // 7
+        metric_count = len(metrics.metric_names)
+
+        current = np.bincount(metrics.metric_code[week == 0], weights=metrics.sum[week == 0],
+                              minlength=metric_count)
+        previous = np.bincount(metrics.metric_code[week == 1], weights=metrics.sum[week == 1],
+                               minlength=metric_count)
+
+        result = []
+        for code, name in enumerate(metrics.metric_names):
+            delta = current[code] - previous[code]
+            result.append({
+                'metric_name': str(name),
+                'current': float(current[code]),
+                'previous': float(previous[code]),
+                'delta': float(delta),
+                'delta_percent': float(delta / previous[code] * 100) if previous[code] else None
+            })
+        return result
+
+    @staticmethod
+    def moving_average(metrics, window=MOVING_AVERAGE_WINDOW, days=30, today=None):
+        """Скользящее среднее дневных сумм каждого показателя за последние days дней.
+
+        Для первых дней периода нужны window - 1 дней до него, поэтому
+        metrics должны покрывать days + window - 1 дней.
+        """
+        today = np.datetime64(today or datetime.now().date(), 'D')
+        start = today - np.timedelta64(days + window - 2, 'D')
+        metric_count = len(metrics.metric_names)
+
+        # Дневные суммы: строка - метрика, столбец - день
+        mask = (metrics.day >= start) & (metrics.day <= today)
+        offsets = (metrics.day[mask] - start).astype(np.int64)
+        daily = np.zeros((metric_count, days + window - 1))
+        np.add.at(daily, (metrics.metric_code[mask], offsets), metrics.sum[mask])
+
+        # Скользящая сумма через накопленные суммы по дням
+        cumulative = np.concatenate((np.zeros((metric_count, 1)), np.cumsum(daily, axis=1)), axis=1)
+        averages = (cumulative[:, window:] - cumulative[:, :-window]) / window
+
+        first_day = start + np.timedelta64(window - 1, 'D')
+        day_labels = [str(first_day + np.timedelta64(index, 'D')) for index in range(averages.shape[1])]
+        return [
+            {
+                'metric_name': str(name),
+                'window': window,
+                'values': [{'day': day, 'value': float(value)} for day, value in zip(day_labels, averages[code])]
+            }
+            for code, name in enumerate(metrics.metric_names)
+        ]
+
+    @staticmethod
+    def get_stats(team_id=None, user_id=None, days=30):
+        """Сводная статистика за последние days дней для команд /stats и /my_stats.
+
+        По сотрудникам считается для команды и всей организации, по
+        командам - только для всей организации.
+        """
+        try:
+            today = datetime.now().date()
+            start_day = today - timedelta(days=days)
+            # Агрегаты читаются с запасом на окно скользящего среднего
+            history = StatsService.load_metrics(
+                team_id=team_id, user_id=user_id,
+                start_day=start_day - timedelta(days=MOVING_AVERAGE_WINDOW - 1)
+            )
+            metrics = history.select(history.day >= np.datetime64(start_day, 'D'))
+
+            summary = StatsService.aggregate(metrics)
+            codes, values = StatsService.load_values(metrics.metric_names, team_id=team_id, user_id=user_id,
+                                                     start_day=start_day)
+            percentiles = StatsService.percentiles(codes, values, len(metrics.metric_names))
+            names = {str(name): code for code, name in enumerate(metrics.metric_names)}
+            for item in summary:
+                for percentile, value in zip(STATS_PERCENTILES, percentiles[names[item['metric_name']]]):
+                    item[f'p{percentile}'] = None if np.isnan(value) else float(value)
+
+            by_user, by_team = [], []
+            if user_id is None:
+                by_user = StatsService.aggregate(metrics, by=('user_id', 'metric_code'))
+            if team_id is None and user_id is None:
+                by_team = StatsService.aggregate(metrics, by=('team_id', 'metric_code'))
+            user_names = StatsService.load_names(User, {item['user_id'] for item in by_user})
+            team_names = StatsService.load_names(Team, {item['team_id'] for item in by_team})
+            for item in by_user:
+                item['user_name'] = user_names.get(item['user_id'], 'Без автора')
+            for item in by_team:
+                item['team_name'] = team_names.get(item['team_id'], 'Без команды')
+
+            return {
+                'reports': int(metrics.count.sum()),
+                'metrics': summary,
+                'by_user': by_user,
+                'by_team': by_team,
+                'week_over_week': StatsService.week_over_week(metrics, today=today),
+                'moving_average': StatsService.moving_average(history, days=days, today=today)
+            }
+        except Exception as e:
+            logger.error(f"Ошибка при расчете статистики: {e}")
+            return None
+
+    @staticmethod
+    def format_stats(stats, days=30):
+        """Текст статистики для сообщения бота"""
+        if stats is None:
+            return "Произошла ошибка при расчете статистики."
+
+        if not stats['metrics']:
+            return f"Нет показателей за последние {days} дней."
+
+        lines = [f"Статистика за последние {days} дней:", ""]
+        changes = {item['metric_name']: item for item in stats['week_over_week']}
+        averages = {item['metric_name']: item for item in stats['moving_average']}
+
+        for item in stats['metrics']:
+            lines.append(f"{item['metric_name']}:")
+            lines.append(f"  Отчетов: {item['count']}, сумма: {item['sum']:g}, среднее: {item['mean']:.2f}")
+            if item.get('p50') is not None:
+                lines.append(f"  Мин/медиана/p90/макс: {item['min']:g} / {item['p50']:g} / "
+                             f"{item['p90']:g} / {item['max']:g}")
+            else:
+                lines.append(f"  Мин/макс: {item['min']:g} / {item['max']:g}")
+
+            average = averages.get(item['metric_name'])
+            if average and average['values']:
+                lines.append(f"  Среднее за {average['window']} дней: {average['values'][-1]['value']:.2f} в день")
+
+            change = changes.get(item['metric_name'])
+            if change and change['delta_percent'] is not None:
+                lines.append(f"  За неделю: {change['current']:g} ({change['delta_percent']:+.1f}%)")
+            elif change:
+                lines.append(f"  За неделю: {change['current']:g}")
+
+        for title, items, name_key in (
+            ("По командам:", stats.get('by_team', []), 'team_name'),
+            ("По сотрудникам:", stats.get('by_user', []), 'user_name')
+        ):
+            if not items:
+                continue
+            lines.extend(["", title])
+            for item in sorted(items, key=lambda item: (item[name_key], item['metric_name'])):
+                lines.append(f"  {item[name_key]}, {item['metric_name']}: отчетов {item['count']}, "
+                             f"сумма {item['sum']:g}, среднее {item['mean']:.2f}")
+
+        return "\n".join(lines)
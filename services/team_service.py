@@ -5,7 +5,8 @@ from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from db.models import Team
-from db.database import get_session
+from db.database import get_session, commit_session, rollback_session, close_session
+from services.dto import TeamDTO
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -19,12 +20,12 @@ class TeamService:
         session = get_session()
         try:
             team = session.query(Team).filter(Team.id == team_id).first()
-            return team
+            return TeamDTO.from_model(team)
         except Exception as e:
             logger.error(f"Ошибка при получении команды: {e}")
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def get_team_by_name(name):
@@ -32,12 +33,12 @@ class TeamService:
         session = get_session()
         try:
             team = session.query(Team).filter(Team.name == name).first()
-            return team
+            return TeamDTO.from_model(team)
         except Exception as e:
             logger.error(f"Ошибка при получении команды по названию: {e}")
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def create_team(name, description=None):
@@ -45,10 +46,10 @@ class TeamService:
         session = get_session()
         try:
             # Проверка существования команды с таким названием
-            existing_team = TeamService.get_team_by_name(name)
+            existing_team = session.query(Team).filter(Team.name == name).first()
             if existing_team:
                 logger.info(f"Команда с названием '{name}' уже существует")
-                return existing_team
+                return TeamDTO.from_model(existing_team)
 
             # Создание новой команды
             team = Team(
@@ -56,15 +57,15 @@ class TeamService:
                 description=description
             )
             session.add(team)
-            session.commit()
+            commit_session(session)
             logger.info(f"Создана новая команда: {name}")
-            return team
+            return TeamDTO.from_model(team)
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при создании команды: {e}")
+            rollback_session(session)
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def update_team(team_id, **kwargs):
@@ -81,16 +82,16 @@ class TeamService:
                 if hasattr(team, key):
                     setattr(team, key, value)
             
-            team.updated_at = datetime.now()
-            session.commit()
+            team.updated_at = datetime.utcnow()
+            commit_session(session)
             logger.info(f"Данные команды '{team.name}' обновлены")
-            return team
+            return TeamDTO.from_model(team)
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при обновлении команды: {e}")
+            rollback_session(session)
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def get_all_teams():
@@ -98,12 +99,12 @@ class TeamService:
         session = get_session()
         try:
             teams = session.query(Team).all()
-            return teams
+            return [TeamDTO.from_model(team) for team in teams]
         except Exception as e:
             logger.error(f"Ошибка при получении списка команд: {e}")
             return []
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def delete_team(team_id):
@@ -116,12 +117,12 @@ class TeamService:
                 return False
 
             session.delete(team)
-            session.commit()
+            commit_session(session)
             logger.info(f"Команда '{team.name}' удалена")
             return True
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при удалении команды: {e}")
+            rollback_session(session)
             return False
         finally:
-            session.close() 
\ No newline at end of file
+            close_session(session) 
\ No newline at end of file
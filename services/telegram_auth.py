@@ -0,0 +1,106 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+from urllib.parse import parse_qsl
+from services.cache import TTLCache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Максимальный возраст данных авторизации (auth_date) в секундах
+TELEGRAM_AUTH_MAX_AGE = int(os.getenv('TELEGRAM_AUTH_MAX_AGE', '86400'))
+
+# Число запоминаемых проверенных подписей
+TELEGRAM_AUTH_CACHE_SIZE = int(os.getenv('TELEGRAM_AUTH_CACHE_SIZE', '4096'))
+
+class TelegramAuth:
+    """Проверка подписи данных Telegram WebApp (initData) и Login Widget.
+
+    Секретные ключи вычисляются один раз при создании объекта. Успешно
+    проверенные строки запоминаются до истечения срока их auth_date, поэтому
+    повторные запросы из той же сессии WebApp не пересчитывают HMAC.
+    """
+
+    def __init__(self, token, max_age=TELEGRAM_AUTH_MAX_AGE, cache_size=TELEGRAM_AUTH_CACHE_SIZE):
+        token = (token or '').encode()
+        self.max_age = max_age
+        self._webapp_secret = hmac.new(b"WebAppData", token, hashlib.sha256).digest()
+        self._login_secret = hashlib.sha256(token).digest()
+        self._cache = TTLCache(maxsize=cache_size, ttl=max_age)
+
+    def _get_expiry(self, auth_date):
+        """Оставшееся время действия данных в секундах или None, если данные устарели"""
+        try:
+            remaining = int(auth_date) + self.max_age - time.time()
+        except (TypeError, ValueError):
+            return None
+        return remaining if remaining > 0 else None
+
+    @staticmethod
+    def _check_hash(secret, fields, received_hash):
+        data_check_string = '\n'.join(f"{k}={v}" for k, v in sorted(fields.items()))
+        calculated_hash = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+        # compare_digest на str с не-ASCII символами бросает TypeError, поэтому сравниваются байты
+        return hmac.compare_digest(calculated_hash.encode(), str(received_hash).encode())
+
+    def validate_init_data(self, init_data):
+        """Проверка строки initData от Telegram WebApp.
+
+        Возвращает копию словаря полей initData или None, если подпись неверна или данные устарели.
+        """
+        if not init_data:
+            return None
+
+        cached = self._cache.get(('webapp', init_data))
+        if cached is not None:
+            return dict(cached)
+
+        try:
+            fields = dict(parse_qsl(init_data, keep_blank_values=True))
+            received_hash = fields.pop('hash', None)
+            if not received_hash:
+                return None
+
+            expires_in = self._get_expiry(fields.get('auth_date'))
+            if expires_in is None:
+                logger.warning("Устаревшие данные Telegram WebApp")
+                return None
+
+            if not self._check_hash(self._webapp_secret, fields, received_hash):
+                return None
+
+            self._cache.set(('webapp', init_data), fields, ttl=expires_in)
+            return dict(fields)
+        except Exception as e:
+            logger.error(f"Ошибка при проверке данных Telegram WebApp: {e}")
+            return None
+
+    def verify_login_data(self, data):
+        """Проверка данных Telegram Login Widget (словарь полей формы)"""
+        if not data:
+            return False
+
+        received_hash = data.get('hash')
+        if not received_hash:
+            return False
+
+        fields = {k: v for k, v in data.items() if k != 'hash'}
+        key = ('login', tuple(sorted(fields.items())), received_hash)
+        if self._cache.get(key) is not None:
+            return True
+
+        expires_in = self._get_expiry(fields.get('auth_date'))
+        if expires_in is None:
+            return False
+
+        if not self._check_hash(self._login_secret, fields, received_hash):
+            return False
+
+        self._cache.set(key, True, ttl=expires_in)
+        return True
+
+    def stats(self):
+        """Статистика кэша проверенных подписей"""
+        return self._cache.stats()
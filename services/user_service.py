@@ -2,41 +2,66 @@ import sys
 import os
 import logging
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from db.models import User
-from db.database import get_session
+from db.database import get_session, commit_session, rollback_session, close_session, run_after_commit
 from config.config import USER_ROLES
+from services.cache import TTLCache
+from services.metrics import metrics
+from services.dto import UserDTO
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Кэш пользователей по Telegram ID (размер и время жизни в секундах)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
 class UserService:
     """Сервис для работы с пользователями"""
 
+    _user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+    @staticmethod
+    def _query_users(session):
+        """Запрос пользователей вместе с их командами"""
+        return session.query(User).options(joinedload(User.team))
+
     @staticmethod
     def get_user_by_telegram_id(telegram_id):
         """Получение пользователя по Telegram ID"""
+        user = UserService._user_cache.get(telegram_id)
+        if user is not None:
+            return user
+
         session = get_session()
         try:
-            user = session.query(User).filter(User.telegram_id == telegram_id).first()
+            # Команда загружается тем же запросом для снимка пользователя
+            user = UserDTO.from_model(UserService._query_users(session).filter(
+                User.telegram_id == telegram_id
+            ).first())
+            # Отсутствующих пользователей не кэшируем, чтобы не мешать регистрации
+            if user:
+                UserService._user_cache.set(telegram_id, user)
             return user
         except Exception as e:
             logger.error(f"Ошибка при получении пользователя: {e}")
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def create_user(telegram_id, username, full_name, role=USER_ROLES['EMPLOYEE'], team_id=None):
         """Создание нового пользователя"""
         session = get_session()
         try:
-            # Проверка существования пользователя
-            existing_user = UserService.get_user_by_telegram_id(telegram_id)
+            # Проверка существования пользователя в той же сессии
+            existing_user = UserService._query_users(session).filter(User.telegram_id == telegram_id).first()
             if existing_user:
                 logger.info(f"Пользователь уже существует: {existing_user.full_name}")
-                return existing_user
+                return UserDTO.from_model(existing_user)
 
             # Создание нового пользователя
             user = User(
@@ -47,22 +72,23 @@ class UserService:
                 team_id=team_id
             )
             session.add(user)
-            session.commit()
+            commit_session(session)
+            run_after_commit(session, lambda: UserService.invalidate_user_cache(telegram_id))
             logger.info(f"Создан новый пользователь: {user.full_name}")
-            return user
+            return UserDTO.from_model(user)
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при создании пользователя: {e}")
+            rollback_session(session)
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def update_user(telegram_id, **kwargs):
         """Обновление данных пользователя"""
         session = get_session()
         try:
-            user = session.query(User).filter(User.telegram_id == telegram_id).first()
+            user = UserService._query_users(session).filter(User.telegram_id == telegram_id).first()
             if not user:
                 logger.warning(f"Пользователь с Telegram ID {telegram_id} не найден")
                 return None
@@ -72,23 +98,24 @@ class UserService:
                 if hasattr(user, key):
                     setattr(user, key, value)
             
-            user.updated_at = datetime.now()
-            session.commit()
+            user.updated_at = datetime.utcnow()
+            commit_session(session)
+            run_after_commit(session, lambda: UserService.invalidate_user_cache(telegram_id))
             logger.info(f"Данные пользователя {user.full_name} обновлены")
-            return user
+            return UserDTO.from_model(user)
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при обновлении пользователя: {e}")
+            rollback_session(session)
             return None
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def get_all_users(role=None, team_id=None):
         """Получение списка пользователей с возможностью фильтрации"""
         session = get_session()
         try:
-            query = session.query(User)
+            query = UserService._query_users(session)
             
             if role:
                 query = query.filter(User.role == role)
@@ -97,12 +124,12 @@ class UserService:
                 query = query.filter(User.team_id == team_id)
             
             users = query.all()
-            return users
+            return [UserDTO.from_model(user) for user in users]
         except Exception as e:
             logger.error(f"Ошибка при получении списка пользователей: {e}")
             return []
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def delete_user(telegram_id):
@@ -115,15 +142,16 @@ class UserService:
                 return False
 
             session.delete(user)
-            session.commit()
+            commit_session(session)
+            run_after_commit(session, lambda: UserService.invalidate_user_cache(telegram_id))
             logger.info(f"Пользователь {user.full_name} удален")
             return True
         except Exception as e:
-            session.rollback()
             logger.error(f"Ошибка при удалении пользователя: {e}")
+            rollback_session(session)
             return False
         finally:
-            session.close()
+            close_session(session)
 
     @staticmethod
     def is_admin(telegram_id):
@@ -135,4 +163,19 @@ class UserService:
     def is_manager(telegram_id):
         """Проверка является ли пользователь руководителем"""
         user = UserService.get_user_by_telegram_id(telegram_id)
-        return user and user.role == USER_ROLES['MANAGER'] 
\ No newline at end of file
+        return user and user.role == USER_ROLES['MANAGER']
+
+    @staticmethod
+    def invalidate_user_cache(telegram_id=None):
+        """Сброс кэша пользователя (или всего кэша, если ID не указан)"""
+        if telegram_id is None:
+            UserService._user_cache.clear()
+        else:
+            UserService._user_cache.delete(telegram_id)
+
+    @staticmethod
+    def get_cache_stats():
+        """Статистика попаданий в кэш пользователей"""
+        return UserService._user_cache.stats()
+
+metrics.register_stats('cache', UserService._user_cache.stats, cache='user')